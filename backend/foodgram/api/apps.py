@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from rest_framework.serializers import BaseSerializer
+
+        from api import checks, signals  # noqa: F401
+        from foodgram.telemetry import time_serializers
+        time_serializers(BaseSerializer)
@@ -0,0 +1,330 @@
+"""Сценарии нагрузочного прогона API для команды benchmark_api."""
+import base64
+import io
+import statistics
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from recipes import saved
+from recipes.counters import COUNTERS, reconcile
+from recipes.feed import backfill
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            RecipeTag, ShoppingCart, ShoppingListItem, Tag)
+from foodgram.settings import RECIPE_CACHE_ALIAS
+from recipes.search import update_documents
+from users.models import Follow, User
+
+SEED_IMAGE = 'recipes/images/temp.jpeg'
+
+
+def without_render_cache():
+    """Отключить кэш отрисованных рецептов: замер должен показывать
+    запросы промаха, а не попадания."""
+    return override_settings(CACHES=dict(settings.CACHES, **{
+        RECIPE_CACHE_ALIAS: {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+        },
+    }))
+
+
+@dataclass
+class Dataset:
+    """Параметры синтетических данных."""
+    users: int = 50
+    recipes: int = 200
+    ingredients: int = 500
+    ingredients_per_recipe: int = 10
+    tags: int = 5
+    favorites: int = 30
+    follows: int = 30
+    cart: int = 30
+
+
+@dataclass
+class Scenario:
+    """Один запрос к API с подготовкой и уборкой вокруг замера."""
+    name: str
+    method: str
+    url: str
+    data: Optional[dict] = None
+    anonymous: bool = False
+    setup: Optional[Callable] = None
+    teardown: Optional[Callable] = None
+
+
+@dataclass
+class Measurement:
+    name: str
+    queries: int
+    timings: list = field(default_factory=list)
+    peak_memory: int = 0
+
+    @property
+    def p50(self):
+        return statistics.median(self.timings) * 1000
+
+    @property
+    def p95(self):
+        ordered = sorted(self.timings)
+        index = max(0, int(round(0.95 * len(ordered))) - 1)
+        return ordered[index] * 1000
+
+
+def image_payload():
+    """Картинка 1x1 в формате, который принимает Base64ImageField."""
+    buffer = io.BytesIO()
+    Image.new('RGB', (1, 1)).save(buffer, format='PNG')
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/png;base64,{encoded}'
+
+
+def seed(dataset):
+    """Заполнить пустую БД и вернуть пользователя, от имени которого
+    идут запросы."""
+    users = User.objects.bulk_create(
+        User(username=f'user{i}', email=f'user{i}@example.com',
+             first_name='Имя', last_name='Фамилия', password='!')
+        for i in range(dataset.users)
+    )
+    ingredients = Ingredient.objects.bulk_create(
+        Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+        for i in range(dataset.ingredients)
+    )
+    tags = Tag.objects.bulk_create(
+        Tag(name=f'тег {i}', color=f'#{i:06d}', slug=f'tag{i}')
+        for i in range(dataset.tags)
+    )
+    recipes = Recipe.objects.bulk_create(
+        Recipe(author=users[i % len(users)], name=f'рецепт {i}',
+               image=SEED_IMAGE, text='Описание', cooking_time=10)
+        for i in range(dataset.recipes)
+    )
+    per_recipe = min(dataset.ingredients_per_recipe, len(ingredients))
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(
+            recipe=recipe,
+            ingredient=ingredients[(i + j) % len(ingredients)],
+            amount=j + 1,
+        )
+        for i, recipe in enumerate(recipes)
+        for j in range(per_recipe)
+    )
+    RecipeTag.objects.bulk_create(
+        RecipeTag(recipe=recipe, tag=tags[i % len(tags)])
+        for i, recipe in enumerate(recipes)
+    )
+    viewer = users[0]
+    Favorite.objects.bulk_create(
+        Favorite(user=viewer, recipe=recipe)
+        for recipe in recipes[:dataset.favorites]
+    )
+    ShoppingCart.objects.bulk_create(
+        ShoppingCart(user=viewer, recipe=recipe)
+        for recipe in recipes[:dataset.cart]
+    )
+    follows = Follow.objects.bulk_create(
+        Follow(user=viewer, following=author)
+        for author in users[1:dataset.follows + 1]
+    )
+    # bulk_create не шлёт сигналов, счётчики считаются заново.
+    for counter in COUNTERS:
+        reconcile(*counter)
+    for follow in follows:
+        backfill(follow.user_id, follow.following_id)
+    ShoppingListItem.objects.rebuild()
+    update_documents([recipe.pk for recipe in recipes])
+    return viewer
+
+
+def build_scenarios(viewer):
+    """Сценарии для каждого маршрута api/urls.py."""
+    recipe = Recipe.objects.exclude(author=viewer).order_by('pk').first()
+    own_recipe = Recipe.objects.filter(author=viewer).order_by('pk').first()
+    spares = list(Recipe.objects.exclude(
+        shopping_cart__user=viewer).exclude(resipes__user=viewer)[:11])
+    spare, batch = spares[0], [recipe.pk for recipe in spares[1:]]
+    cart = list(viewer.shopping_cart.values_list('recipe_id', flat=True))
+    author = User.objects.exclude(
+        following__user=viewer).exclude(pk=viewer.pk).first()
+    followed = User.objects.filter(following__user=viewer).first()
+    tag = Tag.objects.first()
+    ingredient = Ingredient.objects.first()
+    ingredient_ids = list(
+        Ingredient.objects.values_list('pk', flat=True)[:10]
+    )
+    recipe_payload = {
+        'tags': [tag.pk],
+        'ingredients': [
+            {'id': pk, 'amount': 10} for pk in ingredient_ids
+        ],
+        'name': 'Новый рецепт',
+        'image': image_payload(),
+        'text': 'Описание',
+        'cooking_time': 5,
+    }
+
+    def delete_created_recipe():
+        Recipe.objects.filter(name='Новый рецепт').delete()
+
+    def create_recipe_to_delete():
+        Recipe.objects.create(
+            author=viewer, name='Удаляемый рецепт', image=SEED_IMAGE,
+            text='Описание', cooking_time=5,
+        )
+
+    def last_recipe_url():
+        return f'/api/recipes/{Recipe.objects.latest("pk").pk}/'
+
+    return [
+        Scenario('recipes-list', 'get', '/api/recipes/?limit=6'),
+        Scenario('recipes-list-anonymous', 'get', '/api/recipes/?limit=6',
+                 anonymous=True),
+        Scenario('recipes-list-cursor', 'get',
+                 '/api/recipes/?limit=6&pagination=cursor'),
+        Scenario('recipes-list-filtered', 'get',
+                 f'/api/recipes/?limit=6&tags={tag.slug}'
+                 f'&is_favorited=1&is_in_shopping_cart=1'),
+        Scenario('recipes-list-ingredients', 'get',
+                 f'/api/recipes/?limit=6&ingredients={ingredient_ids[0]}'
+                 f'&exclude_ingredients={ingredient_ids[-1]}'),
+        Scenario('recipes-list-pantry', 'get',
+                 '/api/recipes/?limit=6&max_missing=2&pantry='
+                 + ','.join(map(str, ingredient_ids))),
+        Scenario('recipes-search', 'get',
+                 '/api/recipes/?limit=6&search=ингредиент'),
+        Scenario('recipes-detail', 'get', f'/api/recipes/{recipe.pk}/'),
+        Scenario('recipes-create', 'post', '/api/recipes/',
+                 data=recipe_payload, teardown=delete_created_recipe),
+        Scenario('recipes-update', 'patch',
+                 f'/api/recipes/{own_recipe.pk}/',
+                 data=dict(recipe_payload, name='Изменённый рецепт')),
+        Scenario('recipes-delete', 'delete', last_recipe_url,
+                 setup=create_recipe_to_delete),
+        Scenario('recipes-favorite-add', 'post',
+                 f'/api/recipes/{spare.pk}/favorite/',
+                 teardown=lambda: Favorite.objects.filter(
+                     user=viewer, recipe=spare).delete()),
+        Scenario('recipes-favorite-remove', 'delete',
+                 f'/api/recipes/{spare.pk}/favorite/',
+                 setup=lambda: Favorite.objects.create(
+                     user=viewer, recipe=spare)),
+        Scenario('recipes-shopping-cart-add', 'post',
+                 f'/api/recipes/{spare.pk}/shopping_cart/',
+                 teardown=lambda: ShoppingCart.objects.filter(
+                     user=viewer, recipe=spare).delete()),
+        Scenario('recipes-shopping-cart-remove', 'delete',
+                 f'/api/recipes/{spare.pk}/shopping_cart/',
+                 setup=lambda: ShoppingCart.objects.create(
+                     user=viewer, recipe=spare)),
+        Scenario('recipes-favorite-batch-add', 'post',
+                 '/api/recipes/favorite/', data={'recipes': batch},
+                 teardown=lambda: saved.remove(Favorite, viewer, batch)),
+        Scenario('recipes-shopping-cart-batch-add', 'post',
+                 '/api/recipes/shopping_cart/', data={'recipes': batch},
+                 teardown=lambda: saved.remove(ShoppingCart, viewer, batch)),
+        Scenario('recipes-shopping-cart-batch-remove', 'delete',
+                 '/api/recipes/shopping_cart/', data={'recipes': batch},
+                 setup=lambda: saved.add(ShoppingCart, viewer, batch)),
+        Scenario('recipes-shopping-cart-clear', 'delete',
+                 '/api/recipes/shopping_cart/clear/',
+                 teardown=lambda: saved.add(ShoppingCart, viewer, cart)),
+        Scenario('recipes-download-shopping-cart', 'get',
+                 '/api/recipes/download_shopping_cart/'),
+        Scenario('recipes-download-shopping-cart-csv', 'get',
+                 '/api/recipes/download_shopping_cart/?filetype=csv'),
+        Scenario('recipes-download-shopping-cart-json', 'get',
+                 '/api/recipes/download_shopping_cart/?filetype=json'),
+        Scenario('tags-list', 'get', '/api/tags/'),
+        Scenario('tags-detail', 'get', f'/api/tags/{tag.pk}/'),
+        Scenario('ingredients-list', 'get', '/api/ingredients/'),
+        Scenario('ingredients-search', 'get', '/api/ingredients/?name=ингр'),
+        Scenario('ingredients-detail', 'get',
+                 f'/api/ingredients/{ingredient.pk}/'),
+        Scenario('subscriptions-list', 'get',
+                 '/api/users/subscriptions/?limit=6&recipes_limit=3'),
+        Scenario('subscribe', 'post', f'/api/users/{author.pk}/subscribe/',
+                 teardown=lambda: Follow.objects.filter(
+                     user=viewer, following=author).delete()),
+        Scenario('unsubscribe', 'delete',
+                 f'/api/users/{followed.pk}/subscribe/',
+                 teardown=lambda: Follow.objects.get_or_create(
+                     user=viewer, following=followed)),
+        Scenario('feed', 'get', '/api/users/feed/?limit=6'),
+        Scenario('users-list', 'get', '/api/users/?limit=6'),
+        Scenario('users-me', 'get', '/api/users/me/'),
+    ]
+
+
+def perform(client, scenario):
+    url = scenario.url() if callable(scenario.url) else scenario.url
+    response = getattr(client, scenario.method)(
+        url, data=scenario.data, format='json'
+    )
+    if getattr(response, 'streaming', False):
+        for _ in response.streaming_content:
+            pass
+    if response.status_code >= 400:
+        raise AssertionError(
+            f'{scenario.name}: {response.status_code} '
+            f'{response.content[:200]!r}'
+        )
+    return response
+
+
+def measure(scenario, viewer, repeat):
+    """Прогнать сценарий repeat раз: число запросов к БД (максимум),
+    время каждого прогона и пик памяти."""
+    client = APIClient()
+    if not scenario.anonymous:
+        client.force_authenticate(viewer)
+    result = Measurement(scenario.name, queries=0)
+    for attempt in range(repeat + 1):
+        if scenario.setup:
+            scenario.setup()
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            perform(client, scenario)
+            elapsed = time.perf_counter() - started
+        if scenario.teardown:
+            scenario.teardown()
+        if attempt == 0:
+            # Первый прогон строит индексы в памяти процесса
+            # (api/indexes.py) и не учитывается.
+            continue
+        result.queries = max(result.queries, len(context.captured_queries))
+        result.timings.append(elapsed)
+
+    if scenario.setup:
+        scenario.setup()
+    tracemalloc.start()
+    try:
+        perform(client, scenario)
+        result.peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    if scenario.teardown:
+        scenario.teardown()
+    return result
+
+
+def check_budget(measurement, budget):
+    """Список нарушений бюджета для одного сценария."""
+    errors = []
+    limits = (
+        ('queries', measurement.queries),
+        ('p95_ms', measurement.p95),
+        ('peak_kib', measurement.peak_memory / 1024),
+    )
+    for key, value in limits:
+        limit = budget.get(key)
+        if limit is not None and value > limit:
+            errors.append(f'{measurement.name}: {key} {value:.1f} > {limit}')
+    return errors
@@ -0,0 +1,116 @@
+"""Кэш отрисованных рецептов.
+
+В кэше лежит часть ответа RecipeReadOnlySerializer, одинаковая для всех
+пользователей: автор, теги, ингредиенты, картинки. Флаги избранного,
+списка покупок и подписки на автора подставляются при каждом запросе.
+
+Ключ собирается из версий рецепта, его автора и справочников тегов
+и ингредиентов. Запись меняет версию после коммита (api/signals.py),
+и старые ключи просто перестают читаться, поэтому ответ, отрисованный
+параллельно с записью, не попадёт в кэш под новой версией.
+
+Версии и отрисовки должны видеть все процессы, иначе запись из воркера
+фоновых задач не сбросит кэш процессов gunicorn. Поэтому кэш работает
+только с общим бэкендом (Redis, Memcached, БД); с DummyCache, который
+стоит по умолчанию, и с LocMemCache процесса он выключен, а LocMemCache
+вдобавок отвергает проверка api/checks.py.
+"""
+import threading
+import uuid
+
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from foodgram.settings import RECIPE_CACHE_ALIAS
+from recipes.catalog import INGREDIENTS, TAGS, get_version
+
+# Поднять при изменении формата ответа, чтобы не читать старые записи.
+RENDER_VERSION = 1
+
+# Бэкенды, которые не делят данные между процессами.
+LOCAL_BACKENDS = (DummyCache, LocMemCache)
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def get_cache():
+    # Берётся при каждом обращении: override_settings(CACHES=...)
+    # подменяет бэкенд без перезапуска.
+    return caches[RECIPE_CACHE_ALIAS]
+
+
+def enabled():
+    return not isinstance(get_cache(), LOCAL_BACKENDS)
+
+
+def _recipe_key(pk):
+    return f'recipe-version:{pk}'
+
+
+def _author_key(pk):
+    return f'author-version:{pk}'
+
+
+def get_versions(keys):
+    """Версии по ключам; отсутствующая версия создаётся заново."""
+    cache = get_cache()
+    versions = cache.get_many(keys)
+    for key in set(keys) - versions.keys():
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        versions[key] = cache.get(key)
+    return versions
+
+
+def invalidate_recipes(recipe_ids):
+    get_cache().delete_many([_recipe_key(pk) for pk in recipe_ids])
+
+
+def invalidate_authors(author_ids):
+    get_cache().delete_many([_author_key(pk) for pk in author_ids])
+
+
+def get_many(recipes, request=None):
+    """Найти отрисованные рецепты: ({id: данные}, {id: ключ}). По ключам
+    из второго словаря промахи сохраняются через set_many. Когда кэш
+    выключен, оба словаря пусты."""
+    if not recipes or not enabled():
+        return {}, {}
+    versions = get_versions(
+        [_recipe_key(recipe.pk) for recipe in recipes]
+        + [_author_key(recipe.author_id) for recipe in recipes]
+    )
+    # URL картинок абсолютные, поэтому хост входит в ключ.
+    origin = (f'{request.scheme}://{request.get_host()}'
+              if request is not None else '')
+    prefix = (f'recipe:{RENDER_VERSION}:{get_version(TAGS)}:'
+              f'{get_version(INGREDIENTS)}:{origin}')
+    keys = {
+        recipe.pk: (
+            f'{prefix}:{recipe.pk}:{versions[_recipe_key(recipe.pk)]}:'
+            f'{versions[_author_key(recipe.author_id)]}'
+        )
+        for recipe in recipes
+    }
+    found = get_cache().get_many(keys.values())
+    rendered = {
+        pk: found[key] for pk, key in keys.items() if key in found
+    }
+    with _stats_lock:
+        _stats['hits'] += len(rendered)
+        _stats['misses'] += len(keys) - len(rendered)
+    return rendered, keys
+
+
+def set_many(keys, rendered):
+    if keys:
+        get_cache().set_many(
+            {keys[pk]: data for pk, data in rendered.items()}
+        )
+
+
+def stats():
+    """Попадания и промахи в этом процессе с момента запуска."""
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,20 @@
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, register
+
+from foodgram.settings import RECIPE_CACHE_ALIAS
+
+
+@register()
+def recipe_cache_check(app_configs, **kwargs):
+    """Кэш рецептов в памяти процесса не узнаёт о записях из других
+    процессов (воркер фоновых задач, другие процессы gunicorn)."""
+    if isinstance(caches[RECIPE_CACHE_ALIAS], LocMemCache):
+        return [Error(
+            f'Кэш {RECIPE_CACHE_ALIAS!r} хранится в памяти процесса.',
+            hint=('Задайте общий RECIPE_CACHE_BACKEND (Redis, Memcached, '
+                  'БД) или отключите кэш бэкендом '
+                  'django.core.cache.backends.dummy.DummyCache.'),
+            id='api.E001',
+        )]
+    return []
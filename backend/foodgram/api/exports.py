@@ -0,0 +1,47 @@
+"""Построчная выгрузка списка покупок в разных форматах.
+
+Каждая функция принимает итератор строк (название, единица, количество)
+и отдаёт файл кусками, не собирая его целиком в памяти.
+"""
+import csv
+import json
+
+
+class Echo:
+    """Буфер для csv.writer, который сразу возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def rows_to_txt(rows):
+    for name, measurement_unit, amount in rows:
+        yield f'{name} - {amount} {measurement_unit} \n'
+
+
+def rows_to_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def rows_to_json(rows):
+    separator = ''
+    yield '['
+    for name, measurement_unit, amount in rows:
+        item = json.dumps(
+            {'name': name, 'measurement_unit': measurement_unit,
+             'amount': amount},
+            ensure_ascii=False,
+        )
+        yield f'{separator}{item}'
+        separator = ','
+    yield ']'
+
+
+EXPORT_FORMATS = {
+    'txt': ('text/plain; charset=utf-8', rows_to_txt),
+    'csv': ('text/csv; charset=utf-8', rows_to_csv),
+    'json': ('application/json', rows_to_json),
+}
@@ -1,43 +1,122 @@
+import json
+
+from django.db import connections
+from django.db.models import Exists, OuterRef
+from django.db.models.expressions import RawSQL
 from django_filters import rest_framework as filter
-from rest_framework.filters import SearchFilter
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+from rest_framework.settings import api_settings
 
-from recipes.models import Recipe, Tag
+from api.indexes import recipe_ingredient_index, tag_index
+from recipes.models import Favorite, Recipe, RecipeTag, ShoppingCart
+from recipes.search import search
 
 
 class NameFilterInFilter(filter.BaseInFilter, filter.CharFilter):
     pass
 
 
+class NumberInFilter(filter.BaseInFilter, filter.NumberFilter):
+    pass
+
+
+def id_list(queryset, ids):
+    """Значение для pk__in: id из индекса одним параметром, а не
+    параметром на каждый id, чтобы не упереться в лимит параметров
+    запроса (в SQLite — 999 у старых версий)."""
+    ids = sorted(ids)
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        return RawSQL('SELECT unnest(%s::bigint[])', (ids, ))
+    if vendor == 'sqlite':
+        return RawSQL('SELECT value FROM json_each(%s)', (json.dumps(ids), ))
+    return ids
+
+
+def tag_choices():
+    return [(slug, slug) for slug in tag_index.get()]
+
+
 class RecipeFilter(filter.FilterSet):
-    tags = filter.ModelMultipleChoiceFilter(
-        queryset=Tag.objects.all(),
-        field_name='tags__slug',
-        to_field_name='slug',
+    # Теги, избранное и список покупок проверяются подзапросами EXISTS:
+    # соединения размножали бы строки рецептов и требовали DISTINCT.
+    # Slug тегов сверяются с индексом в памяти (api/indexes.py).
+    tags = filter.MultipleChoiceFilter(
+        choices=tag_choices,
+        method='tags_filter',
     )
     author = NameFilterInFilter(field_name='author__id', lookup_expr='in')
-    is_favorited = filter.NumberFilter(
-        field_name='resipes__user',
-        method='is_favorited_filter'
-    )
+    is_favorited = filter.NumberFilter(method='is_favorited_filter')
     is_in_shopping_cart = filter.NumberFilter(
-        field_name='shopping_cart__user',
         method='is_shopping_cart_filter'
     )
+    # Фильтры по составу считаются по индексу в памяти (api/indexes.py)
+    # и доходят до БД одним условием pk IN (...).
+    ingredients = NumberInFilter(method='with_ingredients_filter')
+    exclude_ingredients = NumberInFilter(
+        method='without_ingredients_filter'
+    )
+    pantry = NumberInFilter(method='pantry_filter')
+    max_missing = filter.NumberFilter(method='max_missing_filter')
 
     class Meta:
         Model = Recipe
         fields = ('tags', 'author', )
 
+    def tags_filter(self, queryset, name, value):
+        return queryset.filter(Exists(RecipeTag.objects.filter(
+            recipe=OuterRef('pk'), tag_id__in=tag_index.ids(value)
+        )))
+
+    def user_filter(self, queryset, model, value):
+        """Рецепты из избранного или списка покупок пользователя."""
+        if value != 1:
+            return queryset
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.none()
+        return queryset.filter(Exists(model.objects.filter(
+            user=user, recipe=OuterRef('pk')
+        )))
+
     def is_favorited_filter(self, queryset, name, value):
-        if value == 1:
-            return queryset.filter(**{name: self.request.user})
-        return queryset
+        return self.user_filter(queryset, Favorite, value)
 
     def is_shopping_cart_filter(self, queryset, name, value):
-        if value == 1:
-            return queryset.filter(**{name: self.request.user})
+        return self.user_filter(queryset, ShoppingCart, value)
+
+    def with_ingredients_filter(self, queryset, name, value):
+        return queryset.filter(pk__in=id_list(
+            queryset, recipe_ingredient_index.with_all(value)
+        ))
+
+    def without_ingredients_filter(self, queryset, name, value):
+        keep, recipe_ids = recipe_ingredient_index.without(value)
+        if keep:
+            return queryset.filter(pk__in=id_list(queryset, recipe_ids))
+        return queryset.exclude(pk__in=id_list(queryset, recipe_ids))
+
+    def pantry_filter(self, queryset, name, value):
+        max_missing = int(self.form.cleaned_data.get('max_missing') or 0)
+        return queryset.filter(pk__in=id_list(
+            queryset, recipe_ingredient_index.makeable(value, max_missing)
+        ))
+
+    def max_missing_filter(self, queryset, name, value):
+        # Учитывается в pantry_filter.
         return queryset
 
 
-class IngredientSearchFilter(SearchFilter):
-    search_param = ('name')
+class RecipeSearchFilter(BaseFilterBackend):
+    """?search= по названию, описанию, автору и ингредиентам. Без явного
+    ?ordering= результаты сортируются по релевантности."""
+    search_param = api_settings.SEARCH_PARAM
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '')
+        if not text.strip():
+            return queryset
+        queryset = search(queryset, text)
+        if OrderingFilter.ordering_param in request.query_params:
+            return queryset
+        return queryset.order_by('-rank', '-created', '-pk')
@@ -0,0 +1,242 @@
+"""Индексы справочников в памяти процесса.
+
+Индекс строится из БД при первом обращении и перестраивается, когда
+версия справочника в БД (recipes.catalog) меняется. Версию процесс
+перечитывает не чаще раза в CATALOG_VERSION_TTL секунд, поэтому обычное
+обращение к индексу не ходит в БД.
+"""
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from recipes.catalog import (INGREDIENTS, RECIPE_INGREDIENTS, TAGS,
+                             get_changes, get_sequence, get_version)
+from recipes.models import Ingredient, RecipeIngredient, Tag
+
+
+# Длина n-грамм для поиска подстроки в названиях ингредиентов.
+NGRAM = 3
+
+
+class LocalIndex(ABC):
+    """Данные справочника, построенные build() под текущую версию."""
+    catalog = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._data = None
+
+    @abstractmethod
+    def build(self):
+        """Данные индекса, прочитанные из БД."""
+
+    def refresh(self):
+        """Данные под новую версию; по умолчанию строятся заново."""
+        return self.build()
+
+    def get(self):
+        version = get_version(self.catalog)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._data = self.refresh()
+                    self._version = version
+        return self._data
+
+
+class IngredientIndex(LocalIndex):
+    """Отсортированный по названию список ингредиентов для автодополнения:
+    поиск префикса бинарным поиском, затем вхождения подстроки. Вхождения
+    ищутся среди названий, где есть все триграммы запроса; запрос короче
+    NGRAM символов проверяется перебором всех названий."""
+    catalog = INGREDIENTS
+
+    def build(self):
+        rows = sorted(
+            (
+                (name.casefold(), {
+                    'id': pk, 'name': name, 'measurement_unit': unit,
+                })
+                for pk, name, unit in Ingredient.objects.values_list(
+                    'pk', 'name', 'measurement_unit').iterator()
+            ),
+            key=lambda row: (row[0], row[1]['id']),
+        )
+        keys = [key for key, _ in rows]
+        grams = defaultdict(list)
+        for index, key in enumerate(keys):
+            for gram in {key[i:i + NGRAM]
+                         for i in range(len(key) - NGRAM + 1)}:
+                grams[gram].append(index)
+        return keys, [item for _, item in rows], dict(grams)
+
+    def candidates(self, grams, keys, query):
+        """Номера названий, которые могут содержать query, по порядку."""
+        if len(query) < NGRAM:
+            return range(len(keys))
+        postings = sorted(
+            (grams.get(query[i:i + NGRAM], ())
+             for i in range(len(query) - NGRAM + 1)),
+            key=len,
+        )
+        if not postings[0]:
+            return ()
+        return sorted(set(postings[0]).intersection(*postings[1:]))
+
+    def search(self, query, limit=None):
+        keys, items, grams = self.get()
+        query = query.strip().casefold()
+        if not query:
+            return items[:limit]
+        found = []
+        start = bisect_left(keys, query)
+        end = start
+        while end < len(keys) and keys[end].startswith(query):
+            end += 1
+        found.extend(items[start:end])
+        if limit is not None and len(found) >= limit:
+            return found[:limit]
+        for index in self.candidates(grams, keys, query):
+            if start <= index < end or query not in keys[index]:
+                continue
+            found.append(items[index])
+            if limit is not None and len(found) >= limit:
+                break
+        return found
+
+
+class TagIndex(LocalIndex):
+    """Slug тега -> id, чтобы фильтр по тегам не читал таблицу тегов."""
+    catalog = TAGS
+
+    def build(self):
+        return dict(Tag.objects.values_list('slug', 'pk'))
+
+    def ids(self, slugs):
+        tags = self.get()
+        return [tags[slug] for slug in slugs if slug in tags]
+
+
+class RecipeIngredientIndex(LocalIndex):
+    """Инвертированный индекс ингредиент -> рецепты для фильтров по
+    составу. Данные: ({рецепт: ингредиенты}, {ингредиент: рецепты},
+    {число ингредиентов: рецепты}).
+
+    После записи перечитываются только рецепты из журнала изменений;
+    новые данные собираются рядом со старыми, поэтому читающие потоки
+    не видят индекс наполовину обновлённым.
+    """
+    catalog = RECIPE_INGREDIENTS
+
+    def __init__(self):
+        super().__init__()
+        self._sequence = None
+
+    def refresh(self):
+        sequence = get_sequence(self.catalog)
+        changed = get_changes(self.catalog, self._sequence, sequence)
+        self._sequence = sequence
+        if self._data is None or changed is None:
+            return self.build()
+        return self.patch(self._data, changed)
+
+    def load(self, recipe_ids=None):
+        rows = RecipeIngredient.objects.values_list(
+            'recipe_id', 'ingredient_id')
+        if recipe_ids is not None:
+            rows = rows.filter(recipe_id__in=recipe_ids)
+        recipes = defaultdict(set)
+        for recipe_id, ingredient_id in rows.iterator(chunk_size=10000):
+            recipes[recipe_id].add(ingredient_id)
+        return {
+            recipe_id: frozenset(ingredients)
+            for recipe_id, ingredients in recipes.items()
+        }
+
+    def build(self):
+        recipes = self.load()
+        postings = defaultdict(set)
+        sizes = defaultdict(set)
+        for recipe_id, ingredients in recipes.items():
+            sizes[len(ingredients)].add(recipe_id)
+            for ingredient_id in ingredients:
+                postings[ingredient_id].add(recipe_id)
+        return recipes, {
+            ingredient_id: frozenset(recipe_ids)
+            for ingredient_id, recipe_ids in postings.items()
+        }, {size: frozenset(recipe_ids) for size, recipe_ids in sizes.items()}
+
+    def patch(self, data, recipe_ids):
+        recipes, postings, sizes = (dict(part) for part in data)
+        fresh = self.load(recipe_ids)
+        for recipe_id in recipe_ids:
+            old = recipes.pop(recipe_id, frozenset())
+            new = fresh.get(recipe_id, frozenset())
+            if old:
+                sizes[len(old)] = sizes[len(old)] - {recipe_id}
+            if new:
+                recipes[recipe_id] = new
+                sizes[len(new)] = sizes.get(len(new), frozenset()) | {
+                    recipe_id}
+            for ingredient_id in old - new:
+                postings[ingredient_id] = postings[ingredient_id] - {
+                    recipe_id}
+            for ingredient_id in new - old:
+                postings[ingredient_id] = postings.get(
+                    ingredient_id, frozenset()) | {recipe_id}
+        return recipes, postings, sizes
+
+    def with_all(self, ingredient_ids):
+        """Рецепты, в которых есть все ингредиенты."""
+        postings = self.get()[1]
+        found = sorted(
+            (postings.get(ingredient_id, frozenset())
+             for ingredient_id in set(ingredient_ids)),
+            key=len,
+        )
+        return frozenset.intersection(*found) if found else frozenset()
+
+    def with_any(self, ingredient_ids):
+        """Рецепты, в которых есть хотя бы один из ингредиентов."""
+        postings = self.get()[1]
+        return frozenset().union(*(
+            postings.get(ingredient_id, frozenset())
+            for ingredient_id in set(ingredient_ids)
+        ))
+
+    def makeable(self, pantry, max_missing=0):
+        """Рецепты, для которых из ингредиентов pantry не хватает
+        не больше max_missing."""
+        recipes, postings, sizes = self.get()
+        # Больше, чем ингредиентов в самом большом рецепте, не хватать
+        # не может.
+        max_missing = min(max(max_missing, 0), max(sizes, default=0))
+        counts = Counter()
+        for ingredient_id in set(pantry):
+            counts.update(postings.get(ingredient_id, ()))
+        found = {
+            recipe_id for recipe_id, count in counts.items()
+            if len(recipes[recipe_id]) - count <= max_missing
+        }
+        # Рецепты, где хватает всего, кроме не больше max_missing
+        # ингредиентов, даже если из pantry в них нет ничего.
+        for size, recipe_ids in sizes.items():
+            if size <= max_missing:
+                found.update(recipe_ids)
+        return found
+
+    def without(self, ingredient_ids):
+        """Рецепты без этих ингредиентов: (True, id) — оставить только
+        их, (False, id) — исключить эти id; выбирается меньший список."""
+        recipes = self.get()[0]
+        excluded = self.with_any(ingredient_ids)
+        if len(excluded) * 2 <= len(recipes):
+            return False, excluded
+        return True, recipes.keys() - excluded
+
+
+ingredient_index = IngredientIndex()
+tag_index = TagIndex()
+recipe_ingredient_index = RecipeIngredientIndex()
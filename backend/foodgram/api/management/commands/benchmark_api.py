@@ -0,0 +1,103 @@
+import json
+import os
+import tempfile
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+
+from api.benchmarks import (Dataset, build_scenarios, check_budget, measure,
+                            seed, without_render_cache)
+
+BUDGET_PATH = os.path.join(
+    os.path.dirname(__file__), 'data', 'benchmark_budget.json'
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогнать эндпоинты API на временной БД и сравнить число запросов, '
+        'время и память с бюджетом'
+    )
+
+    def add_arguments(self, parser):
+        for name, default in vars(Dataset()).items():
+            parser.add_argument(
+                f'--{name.replace("_", "-")}', type=int, default=default,
+                dest=name,
+            )
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--budget', default=BUDGET_PATH)
+        parser.add_argument(
+            '--only', nargs='*', default=None,
+            help='Имена сценариев, которые нужно прогнать'
+        )
+        parser.add_argument(
+            '--write-budget', action='store_true',
+            help='Записать измеренное число запросов в файл бюджета'
+        )
+
+    def handle(self, *args, **options):
+        dataset = Dataset(**{
+            name: options[name] for name in vars(Dataset())
+        })
+        with open(options['budget'], encoding='utf-8') as file:
+            budget = json.load(file)
+
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with tempfile.TemporaryDirectory() as media_root:
+                with override_settings(MEDIA_ROOT=media_root):
+                    with without_render_cache():
+                        measurements = self.run_scenarios(dataset, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.report(measurements)
+        if options['write_budget']:
+            for measurement in measurements:
+                budget.setdefault(measurement.name, {})['queries'] = (
+                    measurement.queries
+                )
+            with open(options['budget'], 'w', encoding='utf-8') as file:
+                json.dump(budget, file, indent=4, ensure_ascii=False)
+                file.write('\n')
+            return
+
+        errors = []
+        for measurement in measurements:
+            if measurement.name not in budget:
+                errors.append(f'{measurement.name}: нет бюджета')
+                continue
+            errors.extend(check_budget(measurement, budget[measurement.name]))
+        if errors:
+            raise CommandError(
+                'Бюджет превышен:\n' + '\n'.join(errors)
+            )
+        self.stdout.write(self.style.SUCCESS('Бюджет соблюдён.'))
+
+    def run_scenarios(self, dataset, options):
+        viewer = seed(dataset)
+        measurements = []
+        for scenario in build_scenarios(viewer):
+            if options['only'] and scenario.name not in options['only']:
+                continue
+            measurements.append(
+                measure(scenario, viewer, max(options['repeat'], 1))
+            )
+        return measurements
+
+    def report(self, measurements):
+        self.stdout.write(
+            f'{"сценарий":<36}{"запросы":>8}{"p50 мс":>10}'
+            f'{"p95 мс":>10}{"пик КиБ":>10}'
+        )
+        for item in measurements:
+            self.stdout.write(
+                f'{item.name:<36}{item.queries:>8}{item.p50:>10.1f}'
+                f'{item.p95:>10.1f}{item.peak_memory / 1024:>10.0f}'
+            )
@@ -0,0 +1,145 @@
+import re
+
+from django.apps import apps
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import (CaptureQueriesContext, setup_test_environment,
+                               teardown_test_environment)
+from rest_framework.test import APIClient
+
+from api.benchmarks import build_scenarios, perform, without_render_cache
+from users.models import User
+
+# Полный просмотр таблицы в выводе EXPLAIN: Postgres и SQLite.
+SEQ_SCAN = (
+    re.compile(r'Seq Scan on (?P<table>\w+)'),
+    re.compile(r'\bSCAN (?P<table>\w+)(?! USING (COVERING )?INDEX)\b'),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполнить EXPLAIN для запросов, которые эндпоинты API отправляют '
+        'в БД, и отметить полные просмотры больших таблиц'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-rows', type=int, default=1000,
+            help='Таблицы меньшего размера не проверяются'
+        )
+        parser.add_argument(
+            '--user', type=int, default=None,
+            help='id пользователя, от имени которого идут запросы'
+        )
+        parser.add_argument(
+            '--only', nargs='*', default=None,
+            help='Имена сценариев benchmark_api, которые нужно проверить'
+        )
+        parser.add_argument(
+            '--verbose-plans', action='store_true',
+            help='Печатать планы целиком'
+        )
+        parser.add_argument(
+            '--fail', action='store_true',
+            help='Завершиться ошибкой, если найдены полные просмотры'
+        )
+
+    def handle(self, *args, **options):
+        user = (User.objects.get(pk=options['user']) if options['user']
+                else User.objects.order_by('pk').first())
+        if user is None:
+            raise CommandError('В БД нет пользователей.')
+        sizes = self.table_sizes()
+        large = {
+            table for table, rows in sizes.items()
+            if rows >= options['min_rows']
+        }
+        setup_test_environment()
+        try:
+            # Сценарии только читают, но откат не даст им ничего оставить
+            # в БД (например, созданные при первом чтении версии). Без
+            # кэша рецептов в план попадают и запросы отрисовки.
+            with transaction.atomic(), without_render_cache():
+                queries = self.capture_queries(user, options['only'])
+                plans = [(name, self.explain(sql)) for name, sql in queries]
+                transaction.set_rollback(True)
+        finally:
+            teardown_test_environment()
+
+        flagged = 0
+        for name, plan in plans:
+            scans = sorted({
+                match.group('table')
+                for pattern in SEQ_SCAN
+                for match in pattern.finditer(plan)
+                if match.group('table') in large
+            })
+            if scans:
+                flagged += 1
+                self.stdout.write(self.style.WARNING(
+                    f'{name}: полный просмотр '
+                    + ', '.join(f'{table} (~{sizes[table]} строк)'
+                                for table in scans)
+                ))
+            else:
+                self.stdout.write(f'{name}: ok')
+            if options['verbose_plans']:
+                self.stdout.write(plan)
+        if flagged and options['fail']:
+            raise CommandError(f'Запросов с полным просмотром: {flagged}')
+
+    def table_sizes(self):
+        tables = {
+            model._meta.db_table for model in apps.get_models()
+        }
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT relname, reltuples::bigint FROM pg_class '
+                    'WHERE relname = ANY(%s)', [list(tables)]
+                )
+                return dict(cursor.fetchall())
+        return {
+            model._meta.db_table: model.objects.count()
+            for model in apps.get_models()
+        }
+
+    def capture_queries(self, user, only):
+        """SELECT-запросы, которые отправляют GET-сценарии benchmark_api:
+        пары (сценарий #номер, SQL). Повторы одного SQL не дублируются."""
+        client = APIClient()
+        seen = set()
+        queries = []
+        for scenario in build_scenarios(user):
+            if scenario.method != 'get':
+                continue
+            if only and scenario.name not in only:
+                continue
+            client.force_authenticate(None if scenario.anonymous else user)
+            with CaptureQueriesContext(connection) as context:
+                try:
+                    perform(client, scenario)
+                except AssertionError as error:
+                    self.stderr.write(str(error))
+            number = 0
+            for query in context.captured_queries:
+                sql = query['sql']
+                if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+                    continue
+                number += 1
+                if sql not in seen:
+                    seen.add(sql)
+                    queries.append((f'{scenario.name} #{number}', sql))
+        return queries
+
+    def explain(self, sql):
+        """План SQL в том виде, в каком его печатает QuerySet.explain()."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'{connection.ops.explain_query_prefix()} {sql}'
+            )
+            return '\n'.join(
+                row if isinstance(row, str) else ' '.join(map(str, row))
+                for row in cursor.fetchall()
+            )
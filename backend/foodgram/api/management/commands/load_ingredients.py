@@ -1,53 +1,162 @@
 import csv
+import io
+import json
 import os
-import psycopg2
+import time
+from itertools import islice
 
-from dotenv import load_dotenv
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
 
+from recipes.catalog import INGREDIENTS, bump_version
+from recipes.models import Ingredient
 
-load_dotenv()
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+DEFAULT_PATH = os.path.join(DATA_DIR, 'ingredients.csv')
+READ_SIZE = 64 * 1024
 
 
-class Command(BaseCommand):
-    help = 'Заполнить БД данными из csv файла'
-
-    def handle(self, *args, **kwargs):
-        connect = psycopg2.connect(
-            f"host={os.getenv('DB_HOST', default='db')}\n"
-            f"port={os.getenv('DB_PORT', default='5432')}\n"
-            f"dbname={os.getenv('DB_NAME', default='postgres')}\n"
-            f"user={os.getenv('POSTGRES_USER', default='postgres')}\n"
-            f"password={os.getenv('POSTGRES_PASSWORD', default='Chao14785691998')}\n"
-        )
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            yield row[0], row[1]
 
-        cursor = connect.cursor()
 
-        with open('api/management/commands/data/ingredients.csv',
-                  'r', encoding='UTF-8') as file:
-            contents = csv.reader(file)
-            col_names, number_questions = self.get_col_names(
-                cursor,
-                'recipes_ingredient'
-            )
-            insert_records = (
-                f'INSERT INTO recipes_ingredient ({col_names})'
-                f'VALUES({number_questions})'
-            )
-            cursor.executemany(insert_records, contents)
+def read_json(file):
+    """Элементы JSON-массива по одному, не читая файл целиком.
+
+    Элемент — объект с полями name и measurement_unit или пара
+    [название, единица].
+    """
+    decoder = json.JSONDecoder()
+    buffer = file.read(READ_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидался JSON-массив ингредиентов.')
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = file.read(READ_SIZE)
+            if not chunk:
+                raise CommandError('JSON-файл оборвался.')
+            buffer += chunk
+            continue
+        buffer = buffer[end:]
+        if isinstance(item, dict):
+            yield item['name'], item['measurement_unit']
+        else:
+            yield item[0], item[1]
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
 
-        connect.commit()
-        connect.close()
+class Command(BaseCommand):
+    help = (
+        'Загрузить ингредиенты из csv или json файла; уже существующие '
+        'пары название-единица пропускаются'
+    )
 
-    def get_col_names(self, cursor, tablename):
-        cursor.execute(f"SELECT * FROM {tablename}")
-        col_names = ', '.join(
-            [x[0] for x in cursor.description
-            if x[0] != 'id']
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default=DEFAULT_PATH,
+            help='Файл с ингредиентами; по умолчанию data/ingredients.csv'
+        )
+        parser.add_argument(
+            '--format', choices=READERS, default=None,
+            help='Формат файла; по умолчанию по расширению'
         )
-        number_questions = ', '.join(
-            ['%s' for x in
-            range(len(cursor.description) - 1)]
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк отправлять в БД за раз'
         )
 
-        return col_names, number_questions
+    def handle(self, *args, **options):
+        path = options['path']
+        self.verbosity = options['verbosity']
+        file_format = (options['format']
+                       or os.path.splitext(path)[1].lstrip('.').lower())
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        load = (self.load_copy if connection.vendor == 'postgresql'
+                else self.load_bulk)
+        started = time.perf_counter()
+        before = Ingredient.objects.count()
+        with open(path, encoding='UTF-8') as file, transaction.atomic():
+            rows = (
+                (name.strip(), measurement_unit.strip())
+                for name, measurement_unit in READERS[file_format](file)
+            )
+            read = load(batches(rows, options['batch_size']), started)
+        added = Ingredient.objects.count() - before
+        elapsed = time.perf_counter() - started
+        if added:
+            bump_version(INGREDIENTS)
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано {read}, добавлено {added}, '
+            f'пропущено {read - added} за {elapsed:.2f} с '
+            f'({read / elapsed:.0f} строк/с)'
+        ))
+
+    def progress(self, read, started):
+        if self.verbosity > 1:
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'Прочитано {read} строк, {read / elapsed:.0f} строк/с'
+            )
+
+    def load_bulk(self, batches, started):
+        read = 0
+        for batch in batches:
+            Ingredient.objects.bulk_create(
+                (Ingredient(name=name, measurement_unit=measurement_unit)
+                 for name, measurement_unit in batch),
+                ignore_conflicts=True,
+            )
+            read += len(batch)
+            self.progress(read, started)
+        return read
+
+    def load_copy(self, batches, started):
+        """COPY во временную таблицу и одна вставка из неё
+        с пропуском уже существующих пар."""
+        table = Ingredient._meta.db_table
+        read = 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_load '
+                '(name text, measurement_unit text) ON COMMIT DROP'
+            )
+            for batch in batches:
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(batch)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    'COPY ingredient_load FROM STDIN WITH (FORMAT csv)',
+                    buffer,
+                )
+                read += len(batch)
+                self.progress(read, started)
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                f'SELECT DISTINCT name, measurement_unit '
+                f'FROM ingredient_load '
+                f'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
+        return read
@@ -0,0 +1,218 @@
+import http.client
+import importlib.util
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.authtoken.models import Token
+
+from api.benchmarks import Dataset, seed
+from recipes.models import Ingredient, Recipe
+
+# ASGI только для сравнения: сервис работает под WSGI, а uvicorn
+# ставится из requirements-bench.txt.
+SERVERS = {
+    'wsgi': ('foodgram.wsgi:application', ()),
+    'asgi': ('foodgram.asgi:application',
+             ('--worker-class', 'uvicorn.workers.UvicornWorker')),
+}
+HOST = '127.0.0.1'
+START_TIMEOUT = 30
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    index = max(0, int(round(share * len(ordered))) - 1)
+    return ordered[index] * 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест частых GET-запросов под gunicorn на временной БД; '
+        'с --servers wsgi asgi — сравнение с ASGI (uvicorn) при равном числе '
+        'процессов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2,
+                            help='Процессов сервера')
+        parser.add_argument('--concurrency', type=int, default=32,
+                            help='Одновременных клиентов')
+        parser.add_argument('--duration', type=float, default=10,
+                            help='Секунд замера на сервер')
+        parser.add_argument('--warmup', type=float, default=2,
+                            help='Секунд прогрева перед замером')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--servers', nargs='*', choices=SERVERS,
+                            default=['wsgi'])
+        for name, default in vars(Dataset()).items():
+            parser.add_argument(
+                f'--{name.replace("_", "-")}', type=int, default=default,
+                dest=name,
+            )
+
+    def handle(self, *args, **options):
+        if ('asgi' in options['servers']
+                and importlib.util.find_spec('uvicorn') is None):
+            raise CommandError(
+                'Для --servers asgi нужен uvicorn: '
+                'pip install -r requirements-bench.txt'
+            )
+        dataset = Dataset(**{
+            name: options[name] for name in vars(Dataset())
+        })
+        old_name = connection.settings_dict['NAME']
+        with tempfile.TemporaryDirectory() as directory:
+            if connection.vendor == 'sqlite':
+                # Серверы в отдельных процессах: нужна БД в файле.
+                connection.settings_dict['TEST']['NAME'] = os.path.join(
+                    directory, 'load_test.sqlite3'
+                )
+            test_name = connection.creation.create_test_db(
+                verbosity=0, autoclobber=True
+            )
+            try:
+                viewer = seed(dataset)
+                token = Token.objects.create(user=viewer).key
+                paths = self.paths()
+                results = {
+                    server: self.run_server(
+                        server, test_name, token, paths, options
+                    )
+                    for server in options['servers']
+                }
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+        self.report(results, paths)
+
+    def paths(self):
+        recipe = Recipe.objects.order_by('pk').first()
+        ingredient = Ingredient.objects.order_by('pk').first()
+        return (
+            '/api/recipes/?limit=6',
+            f'/api/recipes/{recipe.pk}/',
+            '/api/tags/',
+            f'/api/ingredients/?name={quote(ingredient.name[:3])}',
+            '/api/users/subscriptions/?recipes_limit=3',
+        )
+
+    def run_server(self, server, db_name, token, paths, options):
+        application, extra = SERVERS[server]
+        env = dict(os.environ, DB_NAME=db_name)
+        process = subprocess.Popen(
+            (sys.executable, '-m', 'gunicorn', application,
+             '--workers', str(options['workers']),
+             '--bind', f'{HOST}:{options["port"]}', *extra),
+            cwd=settings.BASE_DIR, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+        try:
+            self.wait_ready(process, options['port'], paths[0])
+            headers = {'Authorization': f'Token {token}'}
+            self.load(options, paths, headers, options['warmup'])
+            return self.load(options, paths, headers, options['duration'])
+        finally:
+            process.terminate()
+            process.wait()
+
+    def wait_ready(self, process, port, path):
+        deadline = time.monotonic() + START_TIMEOUT
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(
+                    'Сервер не запустился:\n'
+                    + process.stderr.read().decode(errors='replace')
+                )
+            try:
+                client = http.client.HTTPConnection(HOST, port, timeout=1)
+                client.request('GET', path)
+                if client.getresponse().status == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        raise CommandError('Сервер не ответил за отведённое время.')
+
+    def load(self, options, paths, headers, duration):
+        """Клиенты по кругу запрашивают paths до истечения duration:
+        {путь: [задержки]}, ошибки и фактическая длительность."""
+        timings = defaultdict(list)
+        errors = []
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def client(offset):
+            connection = http.client.HTTPConnection(
+                HOST, options['port'], timeout=30
+            )
+            local = defaultdict(list)
+            failed = 0
+            index = offset
+            while time.monotonic() < deadline:
+                path = paths[index % len(paths)]
+                index += 1
+                started = time.perf_counter()
+                try:
+                    connection.request('GET', path, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                except (OSError, http.client.HTTPException):
+                    connection.close()
+                    failed += 1
+                    continue
+                if response.status != 200:
+                    failed += 1
+                    continue
+                local[path].append(time.perf_counter() - started)
+            connection.close()
+            with lock:
+                for path, values in local.items():
+                    timings[path].extend(values)
+                errors.append(failed)
+
+        started = time.monotonic()
+        threads = [
+            threading.Thread(target=client, args=(offset, ))
+            for offset in range(options['concurrency'])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return timings, sum(errors), time.monotonic() - started
+
+    def report(self, results, paths):
+        self.stdout.write(
+            f'{"сервер":<8}{"путь":<44}{"запросов":>10}{"в сек":>9}'
+            f'{"p50 мс":>9}{"p99 мс":>9}{"ошибки":>8}'
+        )
+        for server, (timings, errors, elapsed) in results.items():
+            everything = [
+                value for values in timings.values() for value in values
+            ]
+            for path in paths:
+                values = timings.get(path)
+                if not values:
+                    continue
+                self.stdout.write(
+                    f'{server:<8}{path:<44}{len(values):>10}'
+                    f'{len(values) / elapsed:>9.1f}'
+                    f'{statistics.median(values) * 1000:>9.1f}'
+                    f'{percentile(values, 0.99):>9.1f}{"":>8}'
+                )
+            if everything:
+                self.stdout.write(self.style.SUCCESS(
+                    f'{server:<8}{"всего":<44}{len(everything):>10}'
+                    f'{len(everything) / elapsed:>9.1f}'
+                    f'{statistics.median(everything) * 1000:>9.1f}'
+                    f'{percentile(everything, 0.99):>9.1f}{errors:>8}'
+                ))
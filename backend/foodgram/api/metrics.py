@@ -0,0 +1,67 @@
+"""Метрики процесса в текстовом формате Prometheus (/api/metrics/).
+
+Гистограммы запросов по маршрутам (foodgram/telemetry.py), соединения
+с БД (foodgram.db), кэш отрисованных рецептов (api/cache.py) и очередь
+фоновых задач (jobs/queue.py). Всё, кроме очереди, считается в памяти
+процесса, поэтому при нескольких процессах gunicorn каждый отдаёт свои
+значения.
+"""
+from api import cache
+from foodgram import db, telemetry
+from jobs import queue
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+QUANTILES = {'p50': '0.5', 'p95': '0.95', 'p99': '0.99', 'max': '1'}
+
+
+def metric(lines, name, kind, title, values):
+    """Дописать метрику: values — пары (метки, значение)."""
+    name = f'foodgram_{name}'
+    lines.append(f'# HELP {name} {title}')
+    lines.append(f'# TYPE {name} {kind}')
+    for labels, value in values:
+        labels = ','.join(f'{key}="{label}"' for key, label in labels)
+        lines.append(
+            f'{name}{{{labels}}} {value}' if labels else f'{name} {value}'
+        )
+
+
+def labelled(label, values):
+    """{значение метки: число} -> пары (метки, значение) для metric()."""
+    return [(((label, key), ), value) for key, value in values.items()]
+
+
+def quantiles(values):
+    return [((('quantile', QUANTILES[key]), ), value)
+            for key, value in values.items()]
+
+
+def render():
+    lines = telemetry.render_histograms()
+    connections = db.stats()
+    metric(lines, 'db_connections_opened_total', 'counter',
+           'Открыто соединений с БД', (((), connections['opened']), ))
+    for name, title in (
+        ('open', 'Открытые соединения с БД'),
+        ('in_use', 'Соединения, занятые запросами'),
+    ):
+        metric(lines, f'db_connections_{name}', 'gauge', title,
+               (((), connections[name]), ))
+    metric(lines, 'db_connect_seconds', 'gauge',
+           'Время открытия последних соединений',
+           quantiles(connections['connect']))
+    hits = cache.stats()
+    metric(lines, 'recipe_cache_requests_total', 'counter',
+           'Обращения к кэшу рецептов',
+           labelled('result', hits))
+    jobs = queue.stats()
+    metric(lines, 'jobs', 'gauge', 'Задачи по статусам',
+           labelled('status', jobs['depth']))
+    metric(lines, 'jobs_oldest_age_seconds', 'gauge',
+           'Возраст самой старой ждущей задачи',
+           (((), jobs['oldest_age']), ))
+    for key, title in (('wait', 'Ожидание'), ('run', 'Выполнение')):
+        metric(lines, f'jobs_{key}_seconds', 'gauge',
+               f'{title} последних задач',
+               quantiles(jobs[key]))
+    return '\n'.join(lines) + '\n'
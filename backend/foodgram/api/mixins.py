@@ -1,5 +1,10 @@
+from django.utils.cache import (get_conditional_response,
+                                patch_cache_control, patch_vary_headers)
 from rest_framework import mixins, viewsets
 
+from foodgram.settings import CATALOG_CACHE_MAX_AGE
+from recipes.catalog import get_version
+
 
 class CreateDestroyViewSet(
     mixins.CreateModelMixin,
@@ -7,3 +12,35 @@ class CreateDestroyViewSet(
     viewsets.GenericViewSet,
 ):
     pass
+
+
+class CatalogConditionalGetMixin:
+    """Условный GET для справочника: ETag из версии справочника, на
+    совпадающий If-None-Match ответ 304; версия берётся из памяти
+    процесса (recipes.catalog), пока не устарела."""
+    catalog = None
+
+    def get_etag(self):
+        return f'"{self.catalog}-{get_version(self.catalog)}"'
+
+    def patch_caching_headers(self, response, etag):
+        response['ETag'] = etag
+        patch_cache_control(
+            response, public=True, max_age=CATALOG_CACHE_MAX_AGE
+        )
+        patch_vary_headers(response, ('Accept', ))
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+        etag = self.get_etag()
+        # Сравнение слабое: nginx с gzip отдаёт ETag как W/"...", и
+        # браузер присылает его обратно в этом виде.
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            return self.patch_caching_headers(response, etag)
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code == 200:
+            self.patch_caching_headers(response, etag)
+        return response
@@ -1,5 +1,89 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from foodgram.settings import MAX_PAGE_SIZE, PAGE_SIZE
 
 
 class Pagination(PageNumberPagination):
+    page_size = PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = MAX_PAGE_SIZE
+
+
+class KeysetCursorPagination(BasePagination):
+    """Курсор — позиция (дата, id) последней записи страницы: следующая
+    страница выбирается условием по индексу, без COUNT(*) и OFFSET, и
+    записи с одинаковой датой не теряются и не повторяются."""
+    cursor_query_param = 'cursor'
+    page_size = PAGE_SIZE
     page_size_query_param = 'limit'
+    max_page_size = MAX_PAGE_SIZE
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            created, pk = base64.urlsafe_b64decode(
+                encoded.encode()).decode().split('|')
+            return datetime.fromisoformat(created), int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self, request, position):
+        if position is None:
+            return None
+        encoded = base64.urlsafe_b64encode(
+            f'{position[0].isoformat()}|{position[1]}'.encode()).decode()
+        return replace_query_param(
+            request.build_absolute_uri(), self.cursor_query_param, encoded
+        )
+
+    def get_paginated_response(self, data, next_link=None):
+        return Response({'next': next_link, 'results': data})
+
+
+class RecipeCursorPagination(KeysetCursorPagination):
+    """Рецепты от новых к старым; при одинаковой дате — по убыванию id,
+    как в индексе recipe_created_idx."""
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        queryset = queryset.order_by('-created', '-pk')
+        if position is not None:
+            queryset = queryset.filter(
+                Q(created__lt=position[0])
+                | Q(created=position[0], pk__lt=position[1])
+            )
+        page = list(queryset[:size + 1])
+        self.next_link = None
+        if len(page) > size:
+            page = page[:size]
+            self.next_link = self.get_next_link(
+                request, (page[-1].created, page[-1].pk)
+            )
+        return page
+
+    def get_paginated_response(self, data, next_link=None):
+        return super().get_paginated_response(data, self.next_link)
+
+
+class FeedCursorPagination(KeysetCursorPagination):
+    """Курсор ленты. Ленту собирает recipes.feed.read, поэтому пагинатор
+    только разбирает и выдаёт курсор, а не режет queryset."""
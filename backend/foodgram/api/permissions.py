@@ -1,5 +1,9 @@
+from secrets import compare_digest
+
 from rest_framework.permissions import SAFE_METHODS, BasePermission
 
+from foodgram.settings import METRICS_TOKEN
+
 
 class AdminOnly(BasePermission):
     def has_permission(self, request, view):
@@ -23,4 +27,16 @@ class AuthorOrReadOnly(BasePermission):
 
     def has_object_permission(self, request, view, obj):
         return (request.method in SAFE_METHODS
-                or obj.author == request.user)
+                or obj.author_id == request.user.pk)
+
+
+class MetricsAccess(BasePermission):
+    """Метрики: админу или по заголовку Authorization: Bearer
+    METRICS_TOKEN (для Prometheus)."""
+    def has_permission(self, request, view):
+        if METRICS_TOKEN and compare_digest(
+            request.headers.get('Authorization', ''),
+            f'Bearer {METRICS_TOKEN}',
+        ):
+            return True
+        return request.user.is_authenticated and request.user.is_admin
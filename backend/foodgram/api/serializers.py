@@ -3,12 +3,20 @@ import base64
 from rest_framework import serializers
 from django.contrib.auth.hashers import make_password
 from django.core.files.base import ContentFile
+from django.db import models, transaction
 from django.shortcuts import get_object_or_404
 
+from api import cache
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            RecipeTag, ShoppingCart, Tag)
+                            RecipeTag, ShoppingCart, ShoppingListItem, Tag,
+                            recipe_prefetches)
 from users.models import Follow, User
-from foodgram.settings import AMOUNT_MIN, MIN_COOKING_TIME
+from foodgram.settings import (AMOUNT_MIN, MAX_IMAGE_DIMENSION,
+                               MAX_IMAGE_SIZE, MIN_COOKING_TIME,
+                               RECIPE_BATCH_LIMIT)
+from recipes.catalog import RECIPE_INGREDIENTS, record_changes
+from recipes.images import schedule_renditions
+from recipes.search import make_document
 
 
 class Base64ImageField(serializers.ImageField):
@@ -16,10 +24,31 @@ class Base64ImageField(serializers.ImageField):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
+            # Размер проверяется до декодирования: 4 символа base64 — 3 байта.
+            if len(imgstr) * 3 // 4 > MAX_IMAGE_SIZE:
+                raise serializers.ValidationError(
+                    f'Картинка больше {MAX_IMAGE_SIZE // (1024 * 1024)} МБ.'
+                )
 
             data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
 
-        return super().to_internal_value(data)
+        image = super().to_internal_value(data)
+        width, height = image.image.size
+        if max(width, height) > MAX_IMAGE_DIMENSION:
+            raise serializers.ValidationError(
+                f'Сторона картинки больше {MAX_IMAGE_DIMENSION} пикселей.'
+            )
+        return image
+
+
+class RenditionField(serializers.ReadOnlyField):
+    """URL уменьшенной копии картинки; пока копии нет — URL оригинала."""
+
+    def get_attribute(self, instance):
+        return super().get_attribute(instance) or instance.image
+
+    def to_representation(self, value):
+        return value.url if value else None
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -34,6 +63,9 @@ class UserSerializer(serializers.ModelSerializer):
         extra_kwargs = {'password': {'write_only': True}}
 
     def get_is_subscribed(self, obj):
+        is_subscribed = getattr(obj, 'is_subscribed', None)
+        if is_subscribed is not None:
+            return is_subscribed
         user_id = self.context.get('request').user.pk
         return Follow.objects.filter(following=obj.pk, user=user_id).exists()
 
@@ -45,6 +77,14 @@ class UserSerializer(serializers.ModelSerializer):
         return data
 
 
+def get_recipes_limit(request):
+    try:
+        recipes_limit = int(request.query_params.get('recipes_limit'))
+    except (ValueError, TypeError):
+        return None
+    return max(recipes_limit, 0)
+
+
 class FollowSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -55,15 +95,6 @@ class FollowSerializer(serializers.ModelSerializer):
             'following': {'required': False},
         }
 
-    def _get_recipes_limit(self):
-        try:
-            recipes_limit = int(
-                self.context.get('request').query_params.get('recipes_limit')
-            )
-        except (ValueError, TypeError):
-            recipes_limit = None
-        return recipes_limit
-
     def validate(self, data):
         following_id = self.context.get('view').kwargs.get('id')
         following = get_object_or_404(User, pk=following_id)
@@ -84,39 +115,19 @@ class FollowSerializer(serializers.ModelSerializer):
         return data
 
     def to_representation(self, obj):
-        recipes_limit = self._get_recipes_limit()
         data = UserSerializer(obj.following, context={'request': obj}).data
-        recipes = Recipe.objects.filter(author=data['id'])
-        count = recipes.count()
-        new_data = ResponseShoppingCartSerializer(
-            recipes[:recipes_limit], many=True).data
-        data['recipes'] = new_data
-        data['recipes_count'] = count
+        recipes = getattr(obj, 'recipes_preview', None)
+        if recipes is None:
+            recipes_limit = get_recipes_limit(self.context.get('request'))
+            recipes = Recipe.objects.filter(
+                author=obj.following_id)[:recipes_limit]
+        data['recipes'] = ResponseShoppingCartSerializer(
+            recipes, many=True).data
+        data['recipes_count'] = obj.following.recipes_count
 
         return data
 
 
-class FavoriteSerializer(serializers.ModelSerializer):
-    user = serializers.SlugRelatedField(
-        queryset=User.objects.all(),
-        slug_field='username',
-        default=serializers.CurrentUserDefault()
-    )
-    recipe = serializers.SlugRelatedField(
-        queryset=Recipe.objects.all(),
-        slug_field='id',
-    )
-
-    class Meta:
-        model = Favorite
-        fields = ('user', 'recipe')
-
-        read_only_fields = ('user',)
-
-    def to_representation(self, obj):
-        return ResponseShoppingCartSerializer(obj.recipe).data
-
-
 class IngredientSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -141,6 +152,18 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ('recipe', 'ingredient', 'amount')
 
 
+class RecipeIngredientReadSerializer(serializers.ModelSerializer):
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit'
+    )
+
+    class Meta:
+        model = RecipeIngredient
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
 class RecipeTagSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -151,7 +174,7 @@ class RecipeTagSerializer(serializers.ModelSerializer):
 class IngredientAmountSerializer(serializers.Serializer):
 
     amount = serializers.IntegerField()
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField()
 
     def validate_amount(self, value):
         if value < AMOUNT_MIN:
@@ -167,11 +190,7 @@ class RecipeSerializer(serializers.ModelSerializer):
         slug_field='username',
         default=serializers.CurrentUserDefault()
     )
-    tags = serializers.SlugRelatedField(
-        queryset=Tag.objects.all(),
-        many=True,
-        slug_field='id',
-    )
+    tags = serializers.ListField(child=serializers.IntegerField())
     ingredients = IngredientAmountSerializer(many=True)
     image = Base64ImageField()
 
@@ -187,146 +206,235 @@ class RecipeSerializer(serializers.ModelSerializer):
             )
         return value
 
-    def create(self, validated_data):
-        ingredients = validated_data.pop('ingredients')
-
-        validate_lst = []
-        for ingredient in ingredients:
-            i = ingredient['id'].pk
-            validate_lst.append(i)
-        new_list = list(set(validate_lst))
-        if len(new_list) != len(validate_lst):
+    def validate_tags(self, value):
+        tag_ids = set(value)
+        found = set(
+            Tag.objects.filter(pk__in=tag_ids).values_list('pk', flat=True)
+        )
+        if found != tag_ids:
+            raise serializers.ValidationError(
+                f'Тэги не найдены: {sorted(tag_ids - found)}.'
+            )
+        return tag_ids
+
+    def validate_ingredients(self, value):
+        amounts = {
+            ingredient['id']: ingredient['amount'] for ingredient in value
+        }
+        if len(amounts) != len(value):
             raise serializers.ValidationError('Ингредиенты дублируются.')
+        found = dict(
+            Ingredient.objects.filter(
+                pk__in=amounts).values_list('pk', 'name')
+        )
+        if found.keys() != amounts.keys():
+            raise serializers.ValidationError(
+                'Ингредиенты не найдены: '
+                f'{sorted(amounts.keys() - found.keys())}.'
+            )
+        # Названия нужны для поискового документа рецепта.
+        self._ingredient_names = list(found.values())
+        return amounts
+
+    def _set_tags(self, recipe, tag_ids, current=frozenset()):
+        """Привести теги рецепта к tag_ids, не трогая неизменные строки."""
+        removed = current - tag_ids
+        if removed:
+            RecipeTag.objects.filter(
+                recipe=recipe, tag_id__in=removed
+            ).delete()
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe=recipe, tag_id=tag_id)
+            for tag_id in tag_ids - current
+        )
 
-        tags = validated_data.pop('tags')
-        recipe = Recipe.objects.create(
-            author=self.context.get('request').user,
-            name=validated_data['name'],
-            image=validated_data['image'],
-            text=validated_data['text'],
-            cooking_time=validated_data['cooking_time'],
+    def _set_ingredients(self, recipe, amounts, current=None):
+        """Привести ингредиенты рецепта к amounts {id: количество}:
+        удалить лишние, добавить новые, обновить изменённые.
+        Возвращает изменения количества {id: разница} у добавленных
+        и обновлённых строк: удалённые вычитает из списков покупок
+        сигнал post_delete."""
+        current = current or {}
+        deltas = {
+            ingredient_id: amount - getattr(current.get(ingredient_id),
+                                            'amount', 0)
+            for ingredient_id, amount in amounts.items()
+        }
+        removed = current.keys() - amounts.keys()
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in current
+        )
+        changed = []
+        for ingredient_id, row in current.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and amount != row.amount:
+                row.amount = amount
+                changed.append(row)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ('amount', ))
+        if current.keys() != amounts.keys():
+            # bulk_create не шлёт сигналов, индекс состава обновляется тут.
+            transaction.on_commit(lambda: record_changes(
+                RECIPE_INGREDIENTS, (recipe.pk, )))
+        return deltas
+
+    def _update_search_document(self, recipe, amounts):
+        user = self.context.get('request').user
+        author = user if recipe.author_id == user.pk else recipe.author
+        names = (self._ingredient_names if amounts is not None
+                 else recipe.ingredients.values_list('name', flat=True))
+        recipe.search_document = make_document(
+            recipe.name, recipe.text, author, names
         )
-        lst_tags = list(set(tags))
-        for tag in lst_tags:
-            current_tag = get_object_or_404(Tag, pk=tag.pk)
-            RecipeTag.objects.create(recipe=recipe, tag=current_tag)
-
-        for ingredient in ingredients:
-            amount = ingredient['amount']
-            data = {
-                'recipe': recipe.pk,
-                'ingredient': ingredient['id'].pk,
-                'amount': amount
-            }
-            serializer = RecipeIngredientSerializer(data=data)
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
 
+    def create(self, validated_data):
+        tag_ids = validated_data.pop('tags')
+        amounts = validated_data.pop('ingredients')
+        validated_data['author'] = self.context.get('request').user
+        validated_data['search_document'] = make_document(
+            validated_data['name'], validated_data['text'],
+            validated_data['author'], self._ingredient_names
+        )
+        with transaction.atomic():
+            recipe = Recipe.objects.create(**validated_data)
+            self._set_tags(recipe, tag_ids)
+            self._set_ingredients(recipe, amounts)
+            schedule_renditions(recipe)
         return recipe
 
     def update(self, instance, validated_data):
-        instance.name = validated_data.get('name')
-        instance.text = validated_data.get('text')
-        instance.cooking_time = validated_data.get('cooking_time')
-        instance.image = validated_data.get('image', instance.image)
-
-        if 'tags' in validated_data:
-            tags = validated_data.pop('tags')
-            lst_tags = list(set(tags))
-            tags_old = instance.tags.all()
-            for tag in tags_old:
-                RecipeTag.objects.filter(
-                    recipe=instance.pk,
-                    tag=tag.pk
-                ).delete()
-            lst_tags_new = []
-            for tag in lst_tags:
-                current_tag = get_object_or_404(Tag, pk=tag.pk)
-                RecipeTag.objects.create(
-                    recipe=get_object_or_404(Recipe, pk=instance.pk),
-                    tag=current_tag)
-                id = current_tag.pk
-                lst_tags_new.append(id)
-            instance.tags.set(lst_tags_new)
-
-        if 'ingredients' in validated_data:
-            ingredients = validated_data.pop('ingredients')
-
-            validate_lst = []
-            for ingredient in ingredients:
-                i = ingredient['id'].pk
-                validate_lst.append(i)
-            new_list = list(set(validate_lst))
-            if len(new_list) != len(validate_lst):
-                raise serializers.ValidationError('Ингредиенты дублируются.')
-
-            ingredients_old = instance.ingredients.all()
-            for ingredient in ingredients_old:
-                RecipeIngredient.objects.filter(
-                    recipe=instance.pk,
-                    ingredient=ingredient.pk
-                ).delete()
-            lst_ingredients = []
-            for ingredient in ingredients:
-                current_amount = ingredient['amount']
-                current_ingredient = get_object_or_404(
-                    Ingredient, pk=ingredient['id'].pk
-                )
-                RecipeIngredient.objects.create(
-                    recipe=get_object_or_404(Recipe, pk=instance.pk),
-                    ingredient=current_ingredient,
-                    amount=current_amount)
-                lst_ingredients.append(current_ingredient)
-            instance.ingredients.set(lst_ingredients)
-
-        instance.save()
+        tag_ids = validated_data.pop('tags', None)
+        amounts = validated_data.pop('ingredients', None)
+        validated_data.pop('author', None)
+        if 'image' in validated_data:
+            instance.image_thumbnail = instance.image_card = ''
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        if amounts is not None or {'name', 'text'} & validated_data.keys():
+            self._update_search_document(instance, amounts)
+
+        with transaction.atomic():
+            instance.save()
+            if 'image' in validated_data:
+                schedule_renditions(instance)
+            if tag_ids is not None:
+                current = set(RecipeTag.objects.filter(
+                    recipe=instance).values_list('tag_id', flat=True))
+                self._set_tags(instance, tag_ids, current)
+            if amounts is not None:
+                current = {
+                    row.ingredient_id: row
+                    for row in RecipeIngredient.objects.filter(
+                        recipe=instance)
+                }
+                # Изменения из сигналов и bulk-записей применяются разом.
+                with ShoppingListItem.objects.batched():
+                    deltas = self._set_ingredients(
+                        instance, amounts, current
+                    )
+                    ShoppingListItem.objects.apply_recipe_change(
+                        instance, deltas
+                    )
         return instance
 
     def to_representation(self, obj):
-        data = RecipeReadOnlySerializer(
-            obj, context={'request': self.context.get('request')}).data
-        ingredients = data.get('ingredients')
-        for ingredient in ingredients:
-            ingredient['amount'] = (
-                RecipeIngredient.objects.get(
-                    recipe=data['id'], ingredient=ingredient['id']
-                ).amount
-            )
-        return data
+        request = self.context.get('request')
+        recipe = Recipe.objects.select_related('author').with_user_flags(
+            request.user).get(pk=obj.pk)
+        return RecipeReadOnlySerializer(
+            recipe, context={'request': request}).data
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Список рецептов: кэш читается одним обращением на страницу."""
+
+    def to_representation(self, data):
+        recipes = data.all() if isinstance(data, models.Manager) else data
+        return self.child.render_many(list(recipes))
 
 
 class RecipeReadOnlySerializer(serializers.ModelSerializer):
+    """Рецепт для выдачи. Общая для всех часть берётся из api.cache,
+    флаги пользователя и счётчик избранного подставляются поверх."""
     tags = TagSerializer(many=True, read_only=True)
     author = UserSerializer(many=False, read_only=True)
-    ingredients = IngredientSerializer(many=True, read_only=True)
+    ingredients = RecipeIngredientReadSerializer(
+        source='recipeingredient_set', many=True, read_only=True
+    )
     is_favorited = serializers.SerializerMethodField('get_is_favorited')
     is_in_shopping_cart = serializers.SerializerMethodField(
         'get_is_in_shopping_cart'
     )
+    image_thumbnail = RenditionField()
+    image_card = RenditionField()
+    favorites_count = serializers.ReadOnlyField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'author', 'tags', 'ingredients', 'name', 'image',
-                  'text', 'cooking_time', 'is_favorited',
-                  'is_in_shopping_cart', )
+                  'image_thumbnail', 'image_card', 'text', 'cooking_time',
+                  'favorites_count', 'is_favorited', 'is_in_shopping_cart', )
+        list_serializer_class = RecipeListSerializer
 
     def to_representation(self, obj):
+        return self.render_many([obj])[0]
+
+    def render_many(self, recipes):
+        request = self.context.get('request')
+        rendered, keys = cache.get_many(recipes, request)
+        misses = [recipe for recipe in recipes if recipe.pk not in rendered]
+        if misses:
+            models.prefetch_related_objects(misses, *recipe_prefetches())
+            fresh = {recipe.pk: self.render(recipe) for recipe in misses}
+            cache.set_many(keys, fresh)
+            rendered.update(fresh)
+        return [self.overlay(rendered[recipe.pk], recipe)
+                for recipe in recipes]
+
+    def render(self, obj):
+        """Часть ответа, не зависящая от пользователя."""
+        obj.author.is_subscribed = False
         data = super(RecipeReadOnlySerializer, self).to_representation(obj)
-        ingredients = data.get('ingredients')
-        for ingredient in ingredients:
-            id = ingredient['id']
-            ingredient['amount'] = (
-                RecipeIngredient.objects.get(
-                    recipe=obj.pk, ingredient=id
-                ).amount
-            )
+        # Счётчик меняется чаще рецепта и берётся из строки запроса.
+        del data['favorites_count']
+        del data['is_favorited'], data['is_in_shopping_cart']
+        del data['author']['is_subscribed']
         return data
 
+    def overlay(self, data, obj):
+        """Добавить к общей части флаги текущего пользователя."""
+        is_subscribed = getattr(obj, 'is_author_subscribed', None)
+        if is_subscribed is None:
+            user_id = self.context.get('request').user.pk
+            is_subscribed = Follow.objects.filter(
+                following=obj.author_id, user=user_id).exists()
+        return dict(
+            data,
+            author=dict(data['author'], is_subscribed=is_subscribed),
+            favorites_count=obj.favorites_count,
+            is_favorited=self.get_is_favorited(obj),
+            is_in_shopping_cart=self.get_is_in_shopping_cart(obj),
+        )
+
     def get_is_favorited(self, obj):
+        is_favorited = getattr(obj, 'is_favorited', None)
+        if is_favorited is not None:
+            return is_favorited
         user_id = self.context.get('request').user.pk
         return Favorite.objects.filter(recipe=obj.pk, user=user_id).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        is_in_shopping_cart = getattr(obj, 'is_in_shopping_cart', None)
+        if is_in_shopping_cart is not None:
+            return is_in_shopping_cart
         user_id = self.context.get('request').user.pk
         return ShoppingCart.objects.filter(
             recipe=obj.pk, user=user_id
@@ -334,27 +442,31 @@ class RecipeReadOnlySerializer(serializers.ModelSerializer):
 
 
 class ResponseShoppingCartSerializer(serializers.ModelSerializer):
+    image_thumbnail = RenditionField()
+    image_card = RenditionField()
 
     class Meta:
-        fields = ('id', 'name', 'image', 'cooking_time', )
+        fields = ('id', 'name', 'image', 'image_thumbnail', 'image_card',
+                  'cooking_time', )
         model = Recipe
 
 
-class ShoppingCartSerializer(serializers.ModelSerializer):
-    user = serializers.SlugRelatedField(
-        queryset=User.objects.all(),
-        slug_field='username',
-        default=serializers.CurrentUserDefault()
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для добавления или удаления пачкой."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=RECIPE_BATCH_LIMIT,
     )
-    recipe = serializers.SlugRelatedField(
-        queryset=Recipe.objects.all(),
-        slug_field='id',
-    )
-
-    class Meta:
-        model = ShoppingCart
-        fields = ('user', 'recipe')
-        read_only_fields = ('user', )
 
-    def to_representation(self, obj):
-        return ResponseShoppingCartSerializer(obj.recipe).data
+    def validate_recipes(self, value):
+        recipe_ids = set(value)
+        if self.context.get('request').method != 'POST':
+            return recipe_ids
+        missing = recipe_ids - set(Recipe.objects.filter(
+            pk__in=recipe_ids).values_list('pk', flat=True))
+        if missing:
+            raise serializers.ValidationError(
+                f'Рецепты не найдены: {sorted(missing)}.'
+            )
+        return recipe_ids
@@ -0,0 +1,35 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api.cache import invalidate_authors, invalidate_recipes
+from recipes.images import renditions_built
+from recipes.models import Recipe, RecipeIngredient, RecipeTag
+from users.models import User
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    # После удаления pk экземпляра обнуляется, поэтому id берётся сразу.
+    pk = instance.pk
+    transaction.on_commit(lambda: invalidate_recipes((pk, )))
+
+
+@receiver(renditions_built, sender=Recipe)
+def renditions_changed(sender, recipe_id, **kwargs):
+    invalidate_recipes((recipe_id, ))
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+@receiver((post_save, post_delete), sender=RecipeTag)
+def recipe_part_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_recipes((instance.recipe_id, )))
+
+
+@receiver((post_save, post_delete), sender=User)
+def author_changed(sender, instance, update_fields=None, **kwargs):
+    # Вход пользователя обновляет только last_login, он не отрисовывается.
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    pk = instance.pk
+    transaction.on_commit(lambda: invalidate_authors((pk, )))
@@ -2,8 +2,8 @@ from django.urls import include, path, re_path
 from rest_framework.routers import DefaultRouter
 
 from api.views import (
-    FollowUnfollowViewSet, FollowViewSet, IngredientViewSet, RecipeViewSet,
-    TagViewSet,
+    FeedViewSet, FollowUnfollowViewSet, FollowViewSet, IngredientViewSet,
+    MetricsView, RecipeViewSet, TagViewSet, UserViewSet,
 )
 
 
@@ -15,13 +15,17 @@ router.register(
     'users/subscriptions',
     FollowViewSet, basename='subscriptions'
 )
+router.register('users/feed', FeedViewSet, basename='feed')
+# После users/subscriptions и users/feed: адрес users/<id>/ иначе
+# перехватил бы их. Заменяет UserViewSet из djoser.urls.
+router.register('users', UserViewSet, basename='user')
 
 
 urlpatterns = [
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('users/<int:id>/subscribe/', FollowUnfollowViewSet.as_view(
         {'post': 'create', 'delete': 'destroy'})
     ),
     path('', include(router.urls), name='api'),
-    path(r'', include('djoser.urls')),
     re_path(r'^auth/', include('djoser.urls.authtoken')),
 ]
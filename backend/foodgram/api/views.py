@@ -1,26 +1,41 @@
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Sum
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Value
+from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import filters, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from rest_framework.viewsets import ModelViewSet
+from rest_framework.views import APIView
+from rest_framework.viewsets import GenericViewSet, ModelViewSet
 
 from users.models import Follow, User
-from api.filters import RecipeFilter, IngredientSearchFilter
-from api.mixins import CreateDestroyViewSet
-from api.permissions import AuthorOrReadOnly, ReadOrAdminOnly
-from api.serializers import (FavoriteSerializer, FollowSerializer,
-                             IngredientSerializer, RecipeIngredient,
-                             RecipeReadOnlySerializer, RecipeSerializer,
-                             ShoppingCartSerializer, TagSerializer)
+from api import metrics
+from api.exports import EXPORT_FORMATS
+from api.filters import RecipeFilter, RecipeSearchFilter
+from api.indexes import ingredient_index
+from api.mixins import CatalogConditionalGetMixin, CreateDestroyViewSet
+from api.pagination import FeedCursorPagination, RecipeCursorPagination
+from api.permissions import (AuthorOrReadOnly, MetricsAccess,
+                             ReadOrAdminOnly)
+from api.serializers import (FollowSerializer, IngredientSerializer,
+                             RecipeIdsSerializer, RecipeReadOnlySerializer,
+                             RecipeSerializer, ResponseShoppingCartSerializer,
+                             TagSerializer, get_recipes_limit)
+from recipes import feed, saved
+from recipes.catalog import INGREDIENTS, TAGS
 from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
-from foodgram.settings import CONTENT_TYPE
+from foodgram.settings import (INGREDIENT_SEARCH_LIMIT,
+                               SHOPPING_CART_CHUNK_SIZE,
+                               SHOPPING_CART_FILENAME,
+                               SHOPPING_CART_FORMAT_PARAM)
 
 
-class TagViewSet(ModelViewSet):
+class TagViewSet(CatalogConditionalGetMixin, ModelViewSet):
+    catalog = TAGS
     serializer_class = TagSerializer
     queryset = Tag.objects.all()
     pagination_class = None
@@ -28,26 +43,55 @@ class TagViewSet(ModelViewSet):
     http_method_names = ('get', )
 
 
-class IngredientViewSet(ModelViewSet):
+class IngredientViewSet(CatalogConditionalGetMixin, ModelViewSet):
+    catalog = INGREDIENTS
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (ReadOrAdminOnly, )
     pagination_class = None
-    filter_backends = (IngredientSearchFilter, )
-    search_fields = ('name', )
     http_method_names = ('get', )
 
+    def list(self, request, *args, **kwargs):
+        """Автодополнение по индексу в памяти: сначала ингредиенты,
+        начинающиеся с name, затем содержащие его; без name — первые
+        по алфавиту. Не больше INGREDIENT_SEARCH_LIMIT."""
+        name = request.query_params.get('name', '')
+        try:
+            limit = int(request.query_params.get('limit'))
+        except (ValueError, TypeError):
+            limit = INGREDIENT_SEARCH_LIMIT
+        limit = min(max(limit, 1), INGREDIENT_SEARCH_LIMIT)
+        return Response(ingredient_index.search(name, limit))
+
 
 class RecipeViewSet(ModelViewSet):
     queryset = Recipe.objects.all()
     http_method_names = ('get', 'post', 'patch', 'delete', )
     permission_classes = (AuthorOrReadOnly, )
-    filter_backends = (DjangoFilterBackend, filters.SearchFilter,
-                       filters.OrderingFilter)
+    # Поиск идёт последним, чтобы сортировка по релевантности не
+    # перекрывалась сортировкой по умолчанию.
+    filter_backends = (DjangoFilterBackend, filters.OrderingFilter,
+                       RecipeSearchFilter)
     ordering = ('-created',)
     filterset_fields = ('author',)
     filterset_class = RecipeFilter
 
+    @property
+    def paginator(self):
+        """?pagination=cursor включает курсорную пагинацию."""
+        if (not hasattr(self, '_paginator')
+                and self.request.query_params.get('pagination') == 'cursor'):
+            self._paginator = RecipeCursorPagination()
+        return super().paginator
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('retrieve', 'list'):
+            queryset = queryset.select_related('author').with_user_flags(
+                self.request.user
+            )
+        return queryset
+
     def get_serializer_class(self):
         if self.action in ('retrieve', 'list'):
             return RecipeReadOnlySerializer
@@ -55,79 +99,149 @@ class RecipeViewSet(ModelViewSet):
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
+        feed.schedule_fan_out(serializer.instance)
+
+    def save_one(self, request, model, pk, exists_message):
+        """Добавить или убрать один рецепт."""
+        try:
+            recipe_id = int(pk)
+        except ValueError:
+            raise NotFound
+        if request.method == 'DELETE':
+            if not saved.remove(model, request.user, (recipe_id, )):
+                raise NotFound
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        recipe = get_object_or_404(Recipe, pk=recipe_id)
+        if not saved.add(model, request.user, (recipe_id, )):
+            return Response({'errors': exists_message},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(ResponseShoppingCartSerializer(recipe).data)
+
+    def save_many(self, request, model):
+        """Добавить или убрать пачку рецептов: {"recipes": [id, ...]}."""
+        serializer = RecipeIdsSerializer(
+            data=request.data, context={'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        if request.method == 'DELETE':
+            saved.remove(model, request.user, recipe_ids)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        saved.add(model, request.user, recipe_ids)
+        return Response(
+            ResponseShoppingCartSerializer(
+                Recipe.objects.filter(pk__in=recipe_ids).order_by('pk'),
+                many=True,
+            ).data,
+            status=status.HTTP_201_CREATED,
+        )
 
     @action(methods=('post', 'delete', ), detail=True,
             permission_classes=(IsAuthenticated, ))
     def favorite(self, request, pk=None):
-        data = {
-            'recipe': pk,
-            'user': self.request.user.username,
-        }
-        if request.method == 'POST':
-            serializer = FavoriteSerializer(data=data)
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            return Response(serializer.data)
-        if request.method == 'DELETE':
-            favorite = get_object_or_404(
-                Favorite, recipe=pk, user=self.request.user.pk
-            )
-            favorite.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return self.save_one(request, Favorite, pk,
+                             'Рецепт уже в избранном.')
 
     @action(methods=('post', 'delete'), detail=True,
             permission_classes=(IsAuthenticated, ))
     def shopping_cart(self, request, pk=None):
-        data = {
-            'recipe': pk,
-            'user': self.request.user.username,
-        }
-        if request.method == 'POST':
-            serializer = ShoppingCartSerializer(data=data)
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            return Response(serializer.data)
-        if request.method == 'DELETE':
-            shopping_cart = get_object_or_404(ShoppingCart, recipe=pk)
-            shopping_cart.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+        return self.save_one(request, ShoppingCart, pk,
+                             'Рецепт уже в списке покупок.')
+
+    @action(methods=('post', 'delete', ), detail=False,
+            url_path='favorite', url_name='favorite-many',
+            permission_classes=(IsAuthenticated, ))
+    def favorite_many(self, request):
+        return self.save_many(request, Favorite)
+
+    @action(methods=('post', 'delete', ), detail=False,
+            url_path='shopping_cart', url_name='shopping-cart-many',
+            permission_classes=(IsAuthenticated, ))
+    def shopping_cart_many(self, request):
+        return self.save_many(request, ShoppingCart)
+
+    @action(methods=('delete', ), detail=False,
+            url_path='shopping_cart/clear',
+            permission_classes=(IsAuthenticated, ))
+    def clear_shopping_cart(self, request):
+        saved.remove(ShoppingCart, request.user)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(methods=('get', ), detail=False,
             permission_classes=(IsAuthenticated, ))
     def download_shopping_cart(self, request):
-        recipes = ShoppingCart.objects.filter(
-            user=request.user.pk).values_list('recipe', flat=True)
-        ingredient_recipe = RecipeIngredient.objects.filter(
-            recipe_id__in=recipes).order_by('ingredient').values(
+        file_format = request.query_params.get(
+            SHOPPING_CART_FORMAT_PARAM, 'txt'
+        )
+        if file_format not in EXPORT_FORMATS:
+            return Response(
+                {SHOPPING_CART_FORMAT_PARAM: (
+                    f'Доступные форматы: {", ".join(EXPORT_FORMATS)}.'
+                )},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        content_type, writer = EXPORT_FORMATS[file_format]
+        rows = request.user.shopping_list.values_list(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        ).order_by(
             'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(Sum('amount'))
-
-        ingredients = {}
-        for ingredient in ingredient_recipe:
-            name = ingredient['ingredient__name']
-            amount = ingredient['amount__sum']
-            measurement_unit = ingredient['ingredient__measurement_unit']
-            ingredients[name] = f"{amount} {measurement_unit}"
-        shopping_cart = []
-        for key, value in ingredients.items():
-            shopping_cart.append(f'{key} - {value} \n')
-
-        response = HttpResponse(shopping_cart, CONTENT_TYPE)
+        ).iterator(chunk_size=SHOPPING_CART_CHUNK_SIZE)
+
+        response = StreamingHttpResponse(
+            writer(rows), content_type=content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{SHOPPING_CART_FILENAME}.{file_format}"'
+        )
         return response
 
 
+class UserViewSet(DjoserUserViewSet):
+    """Пользователи djoser с флагом подписки из подзапроса EXISTS,
+    а не отдельным запросом на каждого пользователя страницы."""
+
+    def get_queryset(self):
+        user = self.request.user
+        if not user.is_authenticated:
+            is_subscribed = Value(False)
+        else:
+            is_subscribed = Exists(Follow.objects.filter(
+                user=user, following=OuterRef('pk')
+            ))
+        return super().get_queryset().annotate(
+            is_subscribed=is_subscribed
+        ).order_by('pk')
+
+
 class FollowViewSet(ModelViewSet):
     serializer_class = FollowSerializer
     permission_classes = (IsAuthenticated, )
 
     def get_queryset(self):
-        user = get_object_or_404(User, username=self.request.user.username)
-        return user.follower.all()
+        return self.request.user.follower.select_related(
+            'following'
+        ).order_by('pk')
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        follows = list(queryset) if page is None else page
+        recipes = Recipe.objects.first_per_author(
+            {follow.following_id for follow in follows},
+            get_recipes_limit(request),
+        )
+        for follow in follows:
+            follow.following.is_subscribed = True
+            follow.recipes_preview = recipes.get(follow.following_id, ())
+        serializer = self.get_serializer(follows, many=True)
+        if page is None:
+            return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        with transaction.atomic():
+            serializer.save(user=self.request.user)
+            feed.schedule_backfill(serializer.instance)
 
 
 class FollowUnfollowViewSet(CreateDestroyViewSet):
@@ -144,4 +258,47 @@ class FollowUnfollowViewSet(CreateDestroyViewSet):
 
     def perform_create(self, serializer):
         following = get_object_or_404(User, pk=self.kwargs.get('id'))
-        serializer.save(user=self.request.user, following=following)
+        with transaction.atomic():
+            serializer.save(user=self.request.user, following=following)
+            feed.schedule_backfill(serializer.instance)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            feed.remove_author(instance.user_id, instance.following_id)
+
+
+class FeedViewSet(GenericViewSet):
+    """Новые рецепты авторов, на которых подписан пользователь."""
+    serializer_class = RecipeReadOnlySerializer
+    permission_classes = (IsAuthenticated, )
+    pagination_class = FeedCursorPagination
+
+    def list(self, request):
+        paginator = self.paginator
+        limit = paginator.get_page_size(request)
+        entries = feed.read(
+            request.user, limit + 1, paginator.decode_cursor(request)
+        )
+        page = entries[:limit]
+        recipes = Recipe.objects.select_related('author').with_user_flags(
+            request.user).in_bulk([recipe_id for _, recipe_id in page])
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for _, recipe_id in page
+             if recipe_id in recipes],
+            many=True,
+        )
+        return paginator.get_paginated_response(
+            serializer.data,
+            paginator.get_next_link(
+                request, page[-1] if len(entries) > limit else None
+            ),
+        )
+
+
+class MetricsView(APIView):
+    permission_classes = (MetricsAccess, )
+
+    def get(self, request):
+        return HttpResponse(metrics.render(),
+                            content_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,57 @@
+"""Учёт соединений с БД в процессе.
+
+ENGINE в настройках — обёртка foodgram.db над драйвером DB_ENGINE
+(foodgram/db/base.py): она замеряет открытие соединений и отмечает,
+сколько из них сейчас заняты запросами. Счётчики общие для процесса,
+по ним подбирается CONN_MAX_AGE и число процессов под max_connections
+сервиса db.
+"""
+import threading
+from collections import deque
+
+from foodgram import telemetry
+from foodgram.settings import DB_CONNECT_RECENT
+
+_stats_lock = threading.Lock()
+_stats = {
+    'opened': 0,
+    'closed': 0,
+    'in_use': 0,
+    'connect_seconds': 0.0,
+}
+_recent = deque(maxlen=DB_CONNECT_RECENT)
+
+
+def connected(seconds):
+    with _stats_lock:
+        _stats['opened'] += 1
+        _stats['connect_seconds'] += seconds
+        _recent.append(seconds)
+    telemetry.record_connect(seconds)
+
+
+def disconnected():
+    with _stats_lock:
+        _stats['closed'] += 1
+
+
+def acquired(delta=1):
+    """Соединение взято запросом (delta=1) или освобождено (-1)."""
+    with _stats_lock:
+        _stats['in_use'] += delta
+
+
+def stats():
+    """Открыто и закрыто соединений с запуска, открыто и занято сейчас,
+    время открытия последних соединений в секундах."""
+    with _stats_lock:
+        result = dict(_stats)
+        recent = sorted(_recent)
+    result['open'] = result['opened'] - result['closed']
+    result['connect'] = {
+        'p50': recent[len(recent) // 2] if recent else 0.0,
+        'p99': (recent[max(0, int(round(0.99 * len(recent))) - 1)]
+                if recent else 0.0),
+        'max': recent[-1] if recent else 0.0,
+    }
+    return result
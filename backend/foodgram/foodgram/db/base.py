@@ -0,0 +1,53 @@
+import logging
+import time
+
+from django.db.utils import load_backend
+
+from foodgram import db, telemetry
+from foodgram.settings import DB_ENGINE
+
+logger = logging.getLogger(__name__)
+
+backend = load_backend(DB_ENGINE)
+
+
+class DatabaseWrapper(backend.DatabaseWrapper):
+    """Соединение драйвера DB_ENGINE с учётом в foodgram.db."""
+
+    busy = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.execute_wrappers.append(telemetry.record_query)
+
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        seconds = time.perf_counter() - started
+        db.connected(seconds)
+        logger.debug('Соединение %s открыто за %.1f мс', self.alias,
+                     seconds * 1000)
+
+    def ensure_connection(self):
+        super().ensure_connection()
+        if not self.busy:
+            self.busy = True
+            db.acquired()
+
+    def release(self):
+        if self.busy:
+            self.busy = False
+            db.acquired(-1)
+
+    def close_if_unusable_or_obsolete(self):
+        # Вызывается на границах запроса (close_old_connections):
+        # соединение остаётся открытым до CONN_MAX_AGE, но свободно.
+        self.release()
+        super().close_if_unusable_or_obsolete()
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            self.release()
+            db.disconnected()
@@ -0,0 +1,17 @@
+import json
+import logging
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись лога одной строкой JSON: время, уровень, логгер, сообщение
+    и поля из extra={'data': {...}}."""
+
+    def format(self, record):
+        payload = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        payload.update(getattr(record, 'data', {}))
+        return json.dumps(payload, ensure_ascii=False, default=str)
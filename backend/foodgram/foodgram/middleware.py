@@ -0,0 +1,56 @@
+import time
+
+from foodgram import nplus1, telemetry
+
+
+class TelemetryMiddleware:
+    """Замеры запроса (foodgram/telemetry.py): заголовок Server-Timing,
+    гистограммы маршрута и поиск N+1 (foodgram/nplus1.py). Стоит первым,
+    чтобы total покрывал остальные middleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with telemetry.recording() as record:
+            if nplus1.sampled():
+                record.repeats = nplus1.Repeats()
+            response = self.get_response(request)
+            self.finish_view(record)
+        if response.streaming and not getattr(response, 'is_async', False):
+            # Запросы к БД при отдаче тела тоже в замере; итог уходит
+            # в гистограммы, когда тело отдано.
+            response['Server-Timing'] = telemetry.server_timing(
+                record, partial=True
+            )
+            response.streaming_content = telemetry.streamed(
+                record, response.streaming_content,
+                lambda record: self.finish(record, request),
+            )
+            return response
+        if not response.streaming:
+            record.size = len(response.content)
+        response['Server-Timing'] = telemetry.server_timing(
+            record, partial=response.streaming
+        )
+        self.finish(record, request)
+        return response
+
+    def finish(self, record, request):
+        telemetry.observe(record)
+        if record.repeats is not None:
+            nplus1.report(record, request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        record = telemetry.current()
+        record.route = telemetry.route(view_func, request.method)
+        record.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # Ответ DRF ещё не отрисован: время до render() — представление.
+        self.finish_view(telemetry.current())
+        return response
+
+    def finish_view(self, record):
+        if record.view_started is not None and not record.view:
+            record.view = time.perf_counter() - record.view_started
@@ -0,0 +1,101 @@
+"""Поиск N+1: один и тот же запрос к БД много раз за HTTP-запрос.
+
+SQL сводится к отпечатку: строки, числа и параметры заменяются на ?,
+списки IN (?, ?, ...) — на (...). Запись запроса (foodgram/telemetry.py)
+считает отпечатки, а на NPLUS1_THRESHOLD-м повторе запоминает стек
+вызова из кода проекта. В конце запроса каждый такой отпечаток уходит
+в лог foodgram.nplus1 одной строкой JSON: маршрут, отпечаток, число
+повторов и место вызова.
+
+Проверяется в среднем каждый NPLUS1_SAMPLE-й запрос, под manage.py test
+и benchmark_api — каждый.
+"""
+import hashlib
+import logging
+import os
+import random
+import re
+import traceback
+
+from foodgram.settings import (BASE_DIR, NPLUS1_SAMPLE, NPLUS1_STACK_DEPTH,
+                               NPLUS1_THRESHOLD)
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w."])-?\d+(?:\.\d+)?\b')
+_PARAM = re.compile(r'%s|\?')
+_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SPACE = re.compile(r'\s+')
+
+PROJECT = str(BASE_DIR) + os.sep
+# Кадры самого учёта в место вызова не попадают.
+OWN = tuple(
+    os.path.join(PROJECT, 'foodgram', name)
+    for name in ('db' + os.sep, 'middleware.py', 'nplus1.py',
+                 'telemetry.py')
+)
+
+
+def fingerprint(sql):
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PARAM.sub('?', sql)
+    sql = _LIST.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def sampled():
+    return NPLUS1_SAMPLE > 0 and random.randrange(NPLUS1_SAMPLE) == 0
+
+
+def call_stack():
+    """Кадры кода проекта, от места вызова наружу."""
+    frames = [
+        frame for frame in reversed(traceback.extract_stack())
+        if frame.filename.startswith(PROJECT)
+        and not frame.filename.startswith(OWN)
+        and 'site-packages' not in frame.filename
+    ]
+    return [
+        f'{os.path.relpath(frame.filename, PROJECT)}:{frame.lineno} '
+        f'in {frame.name}'
+        for frame in frames[:NPLUS1_STACK_DEPTH]
+    ]
+
+
+class Repeats:
+    """Отпечатки запросов к БД одного HTTP-запроса."""
+
+    def __init__(self):
+        self.counts = {}
+        self.stacks = {}
+
+    def seen(self, sql):
+        key = fingerprint(sql)
+        count = self.counts.get(key, 0) + 1
+        self.counts[key] = count
+        if count == NPLUS1_THRESHOLD:
+            self.stacks[key] = call_stack()
+
+    def offenders(self):
+        return [
+            (key, self.counts[key], stack)
+            for key, stack in self.stacks.items()
+        ]
+
+
+def report(record, request):
+    """Записать в лог отпечатки, повторённые NPLUS1_THRESHOLD раз и больше."""
+    for key, count, stack in record.repeats.offenders():
+        logger.warning('Повторяющийся запрос к БД', extra={'data': {
+            'event': 'nplus1',
+            'endpoint': record.route,
+            'method': request.method,
+            'path': request.path,
+            'fingerprint': hashlib.sha1(key.encode()).hexdigest()[:12],
+            'sql': key,
+            'count': count,
+            'call_site': stack[0] if stack else None,
+            'stack': stack,
+        }})
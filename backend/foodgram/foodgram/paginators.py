@@ -0,0 +1,33 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+from foodgram.settings import ADMIN_ESTIMATED_COUNT
+
+
+def estimated_count(model, using):
+    """Число строк таблицы по статистике Postgres; -1, если её нет."""
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class '
+            'WHERE oid = to_regclass(%s)',
+            (model._meta.db_table, ),
+        )
+        row = cursor.fetchone()
+    return row[0] if row else -1
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор списков админки: для большой таблицы без фильтров
+    количество берётся из статистики, а не полным COUNT(*)."""
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if (isinstance(queryset, QuerySet) and not queryset.query.where
+                and connections[queryset.db].vendor == 'postgresql'):
+            estimate = estimated_count(queryset.model, queryset.db)
+            if estimate >= ADMIN_ESTIMATED_COUNT:
+                return estimate
+        return super().count
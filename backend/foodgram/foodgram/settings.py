@@ -1,8 +1,8 @@
 import os
-
+import sys
 from pathlib import Path
-from django.core.management.utils import get_random_secret_key
 
+from django.core.management.utils import get_random_secret_key
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,7 +13,73 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 AMOUNT_MIN = 1
 MIN_VALUE = 1
 MIN_COOKING_TIME = 1
-CONTENT_TYPE = 'Content-Type: text/plain'
+SHOPPING_CART_FILENAME = 'shopping_cart'
+SHOPPING_CART_FORMAT_PARAM = 'filetype'
+SHOPPING_CART_CHUNK_SIZE = 500
+INGREDIENT_SEARCH_LIMIT = 50
+CATALOG_CACHE_MAX_AGE = 60
+# Как часто процесс перечитывает версии справочников из БД (recipes.catalog).
+CATALOG_VERSION_TTL = float(os.getenv('CATALOG_VERSION_TTL', default=1))
+PAGE_SIZE = 6
+MAX_PAGE_SIZE = 100
+# Сколько рецептов можно добавить в избранное или список покупок
+# (или убрать из них) одним запросом.
+RECIPE_BATCH_LIMIT = 100
+MAX_IMAGE_SIZE = 5 * 1024 * 1024
+MAX_IMAGE_DIMENSION = 4096
+# Уменьшенные копии картинки рецепта: поле модели -> вписать в (ш, в).
+IMAGE_RENDITIONS = {
+    'image_thumbnail': (160, 160),
+    'image_card': (600, 600),
+}
+IMAGE_RENDITION_FORMAT = 'WEBP'
+# Лента подписок: рецепты авторов, у которых подписчиков больше
+# FEED_FANOUT_LIMIT, не раскладываются по лентам, а подмешиваются
+# при чтении.
+FEED_FANOUT_LIMIT = 10000
+FEED_BATCH_SIZE = 1000
+# Сколько последних рецептов автора попадает в ленту при подписке.
+FEED_BACKFILL = 20
+# Списки админки без фильтров по таблицам больше этого числа строк
+# показывают оценку количества из статистики Postgres вместо COUNT(*).
+ADMIN_ESTIMATED_COUNT = 100000
+# Фоновые задачи (приложение jobs).
+# JOBS_EAGER: выполнять задачи сразу после коммита в том же процессе,
+# без очереди в БД и воркера; для тестов и локальной разработки.
+JOBS_EAGER = bool(int(os.getenv('JOBS_EAGER', default=0)))
+JOBS_WORKERS = int(os.getenv('JOBS_WORKERS', default=2))
+JOBS_POLL_INTERVAL = 1.0
+JOBS_MAX_ATTEMPTS = 5
+# Задача, взятая воркером, снова становится доступной через столько
+# секунд, если воркер не отчитался о результате (упал или завис).
+JOBS_VISIBILITY_TIMEOUT = 300
+# Пауза перед повтором: JOBS_RETRY_DELAY * 2 ** (попытка - 1) секунд.
+JOBS_RETRY_DELAY = 10
+JOBS_KEEP_DONE = 24 * 60 * 60
+# Соединения с БД. DB_ENGINE — драйвер, его оборачивает foodgram.db для
+# учёта соединений. DB_CONN_MAX_AGE — сколько секунд соединение живёт
+# между запросами (0 — закрывается после каждого запроса); перед
+# повторным использованием оно проверяется, если DB_CONN_HEALTH_CHECKS.
+DB_ENGINE = os.getenv('DB_ENGINE')
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', default=60))
+DB_CONN_HEALTH_CHECKS = bool(
+    int(os.getenv('DB_CONN_HEALTH_CHECKS', default=1))
+)
+# По скольким последним открытиям соединения считаются перцентили.
+DB_CONNECT_RECENT = 1000
+# /api/metrics/ доступен админу или с заголовком
+# Authorization: Bearer METRICS_TOKEN.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', default='')
+# Поиск N+1 (foodgram/nplus1.py): отпечаток SQL, повторённый за один
+# запрос NPLUS1_THRESHOLD раз, пишется в лог foodgram.nplus1. Проверяется
+# в среднем каждый NPLUS1_SAMPLE-й запрос (0 — не проверять), под
+# manage.py test и benchmark_api — каждый.
+TESTING = sys.argv[1:2] in (['test'], ['benchmark_api'])
+NPLUS1_THRESHOLD = int(os.getenv('NPLUS1_THRESHOLD', default=5))
+NPLUS1_SAMPLE = (
+    1 if TESTING else int(os.getenv('NPLUS1_SAMPLE', default=100))
+)
+NPLUS1_STACK_DEPTH = 8
 
 ADDRESS = 'http://51.250.67.101'
 CSRF_TRUSTED_ORIGINS = (ADDRESS, )
@@ -53,10 +119,12 @@ INSTALLED_APPS = [
     'api.apps.ApiConfig',
     'recipes.apps.RecipesConfig',
     'users.apps.UsersConfig',
+    'jobs.apps.JobsConfig',
     # 'multiselectfield',
 ]
 
 MIDDLEWARE = [
+    'foodgram.middleware.TelemetryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -91,18 +159,62 @@ WSGI_APPLICATION = 'foodgram.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'foodgram.logs.JsonFormatter'},
+    },
+    'handlers': {
+        'json': {'class': 'logging.StreamHandler', 'formatter': 'json'},
+    },
+    'loggers': {
+        'foodgram.nplus1': {
+            'handlers': ['json'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
 DATABASES = {
     'default': {
-        'ENGINE': os.getenv('DB_ENGINE'),
+        'ENGINE': 'foodgram.db',
         'NAME': os.getenv('DB_NAME'),
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
-        'PORT': os.getenv('DB_PORT')
+        'PORT': os.getenv('DB_PORT'),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
     }
 }
 
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
+    },
+    # Отрисованные рецепты (api/cache.py). Кэш должен быть общим для всех
+    # процессов, иначе они не узнают о записях друг друга; по умолчанию
+    # выключен.
+    'recipes': {
+        'BACKEND': os.getenv(
+            'RECIPE_CACHE_BACKEND',
+            default='django.core.cache.backends.dummy.DummyCache'
+        ),
+        'LOCATION': os.getenv('RECIPE_CACHE_LOCATION', default='recipes'),
+        'TIMEOUT': 24 * 60 * 60,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+RECIPE_CACHE_ALIAS = 'recipes'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -0,0 +1,225 @@
+"""Замеры запроса: запросы к БД, сериализация, представление, размер ответа.
+
+Запись текущего запроса хранится в контекстной переменной.
+Запросы к БД считает execute_wrapper, который обёртка foodgram.db ставит
+на каждое соединение; сериализацию — обёртка BaseSerializer.data.
+Итог запроса уходит в заголовок Server-Timing (foodgram/middleware.py)
+и в гистограммы по маршрутам: ViewSet.action, например
+RecipeViewSet.list. Гистограммы общие для процесса и отдаются в формате
+Prometheus по /api/metrics/.
+
+Тело потокового ответа отдаётся уже после выхода из middleware, поэтому
+его отдача замеряется обёрткой streamed(): гистограммы получают полный
+замер, а заголовок Server-Timing, ушедший до тела, помечен как неполный.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+SECONDS_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+HISTOGRAMS = {
+    'request_duration_seconds': ('total', SECONDS_BUCKETS,
+                                 'Время обработки запроса'),
+    'request_view_seconds': ('view', SECONDS_BUCKETS,
+                             'Время в представлении'),
+    'request_serializer_seconds': ('serializer', SECONDS_BUCKETS,
+                                   'Время сериализации'),
+    'request_db_seconds': ('db', SECONDS_BUCKETS,
+                           'Время запросов к БД'),
+    'request_db_connect_seconds': ('connect', SECONDS_BUCKETS,
+                                   'Время открытия соединений с БД'),
+    'request_db_queries': ('queries', (0, 1, 2, 5, 10, 20, 50, 100, 200),
+                           'Число запросов к БД'),
+    'response_size_bytes': ('size', (256, 1024, 4096, 16384, 65536,
+                                     262144, 1048576, 4194304),
+                            'Размер ответа'),
+}
+# Метрика Server-Timing -> поле записи.
+SERVER_TIMING = (
+    ('db', 'db'), ('db-connect', 'connect'), ('serializer', 'serializer'),
+    ('view', 'view'), ('total', 'total'),
+)
+
+_current = ContextVar('telemetry_request', default=None)
+_lock = threading.Lock()
+# (метрика, маршрут) -> [счётчики по корзинам, сумма, количество].
+_histograms = {}
+
+
+class Record:
+    """Замеры одного запроса; время в секундах."""
+
+    def __init__(self):
+        self.route = 'unmatched'
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.queries = 0
+        self.db = 0.0
+        self.connect = 0.0
+        self.serializer = 0.0
+        self.serializing = False
+        self.view = 0.0
+        self.total = 0.0
+        self.size = None
+        # Отпечатки запросов к БД (foodgram/nplus1.py), если запрос
+        # попал в выборку.
+        self.repeats = None
+
+
+@contextmanager
+def recording():
+    """Завести запись запроса на время блока."""
+    record = Record()
+    token = _current.set(record)
+    try:
+        yield record
+    finally:
+        _current.reset(token)
+        record.total = time.perf_counter() - record.started
+
+
+def current():
+    return _current.get()
+
+
+def record_query(execute, sql, params, many, context):
+    """execute_wrapper: время и число запросов текущего запроса."""
+    record = _current.get()
+    if record is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record.queries += 1
+        record.db += time.perf_counter() - started
+        if record.repeats is not None:
+            record.repeats.seen(sql)
+
+
+def streamed(record, content, finish):
+    """Отдать тело потокового ответа с записью record: запросы к БД при
+    отдаче попадают в неё. finish(record) вызывается, когда тело отдано
+    или ответ закрыт."""
+    iterator = iter(content)
+    size = 0
+    try:
+        while True:
+            token = _current.set(record)
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                _current.reset(token)
+            size += len(chunk)
+            yield chunk
+    finally:
+        record.size = size
+        record.total = time.perf_counter() - record.started
+        finish(record)
+
+
+def record_connect(seconds):
+    record = _current.get()
+    if record is not None:
+        record.connect += seconds
+
+
+def time_serializers(base):
+    """Считать время свойства data у base (BaseSerializer DRF) и его
+    наследников: вложенные .data внутри него не суммируются повторно."""
+    data = base.data.fget
+
+    def timed_data(self):
+        record = _current.get()
+        if record is None or record.serializing:
+            return data(self)
+        record.serializing = True
+        started = time.perf_counter()
+        try:
+            return data(self)
+        finally:
+            record.serializing = False
+            record.serializer += time.perf_counter() - started
+
+    base.data = property(timed_data)
+
+
+def route(view_func, method):
+    """Метка маршрута: ViewSet.action для DRF, иначе имя представления."""
+    viewset = getattr(view_func, 'cls', None)
+    actions = getattr(view_func, 'actions', None)
+    if viewset is not None and actions:
+        action = actions.get(method.lower(), method.lower())
+        return f'{viewset.__name__}.{action}'
+    if viewset is not None:
+        return viewset.__name__
+    return getattr(view_func, '__qualname__', 'view')
+
+
+def server_timing(record, partial=False):
+    """Значение Server-Timing; partial — замер до отдачи тела потокового
+    ответа."""
+    metrics = [
+        f'{name};dur={getattr(record, field) * 1000:.1f}'
+        for name, field in SERVER_TIMING
+    ]
+    metrics[0] += f';desc="{record.queries} queries"'
+    if record.size is not None:
+        metrics.append(f'size;desc="{record.size}"')
+    if partial:
+        metrics.append('partial;desc="body not measured"')
+    return ', '.join(metrics)
+
+
+def observe(record):
+    """Добавить запрос в гистограммы его маршрута."""
+    with _lock:
+        for metric, (field, buckets, _) in HISTOGRAMS.items():
+            value = getattr(record, field)
+            if value is None:
+                continue
+            key = (metric, record.route)
+            if key not in _histograms:
+                _histograms[key] = [[0] * len(buckets), 0, 0]
+            histogram = _histograms[key]
+            index = bisect_left(buckets, value)
+            if index < len(buckets):
+                histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+
+def render_histograms():
+    """Гистограммы процесса в текстовом формате Prometheus."""
+    with _lock:
+        snapshot = {
+            key: (list(counts), total, count)
+            for key, (counts, total, count) in _histograms.items()
+        }
+    lines = []
+    for metric, (_, buckets, title) in HISTOGRAMS.items():
+        name = f'foodgram_{metric}'
+        lines.append(f'# HELP {name} {title}')
+        lines.append(f'# TYPE {name} histogram')
+        for (key, route_name), (counts, total, count) in sorted(
+            snapshot.items()
+        ):
+            if key != metric:
+                continue
+            label = f'route="{route_name}"'
+            cumulative = 0
+            for bound, bucket in zip(buckets, counts):
+                cumulative += bucket
+                lines.append(
+                    f'{name}_bucket{{{label},le="{bound}"}} {cumulative}'
+                )
+            lines.append(f'{name}_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f'{name}_sum{{{label}}} {total}')
+            lines.append(f'{name}_count{{{label}}} {count}')
+    return lines
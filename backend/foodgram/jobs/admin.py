@@ -0,0 +1,14 @@
+from django.contrib import admin
+
+from jobs.models import Job
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'created',
+                    'started', 'finished')
+    list_filter = ('status', 'name')
+    search_fields = ('name', )
+    readonly_fields = ('created', 'started', 'finished', 'last_error')
+
+
+admin.site.register(Job, JobAdmin)
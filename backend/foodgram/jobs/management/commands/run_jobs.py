@@ -0,0 +1,99 @@
+import multiprocessing
+import signal
+import time
+
+from django.core.management import BaseCommand
+from django.db import close_old_connections, connections
+
+from foodgram.settings import JOBS_POLL_INTERVAL, JOBS_WORKERS
+from jobs import queue
+
+# Как часто воркер чистит выполненные задачи, секунды.
+PURGE_INTERVAL = 600
+
+
+def work(once, poll_interval):
+    """Цикл одного процесса-воркера: брать задачи по одной, пока
+    не придёт SIGTERM или, с once, пока очередь не опустеет."""
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *args: stopping.append(True))
+    signal.signal(signal.SIGINT, lambda *args: stopping.append(True))
+    purged = 0
+    while not stopping:
+        close_old_connections()
+        jobs = queue.claim()
+        for job in jobs:
+            queue.execute(job)
+        if time.monotonic() - purged > PURGE_INTERVAL:
+            queue.purge()
+            purged = time.monotonic()
+        if not jobs:
+            if once:
+                break
+            time.sleep(poll_interval)
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Выполнять фоновые задачи из очереди в БД'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=JOBS_WORKERS,
+            help='Число процессов-воркеров'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить доступные задачи и завершиться'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=JOBS_POLL_INTERVAL,
+            help='Пауза между опросами пустой очереди, секунды'
+        )
+        parser.add_argument(
+            '--stats', action='store_true',
+            help='Показать состояние очереди и завершиться'
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.print_stats()
+            return
+        if options['workers'] <= 1:
+            work(options['once'], options['poll_interval'])
+            return
+        # Соединения с БД не должны переходить в дочерние процессы.
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(
+                target=work, args=(options['once'], options['poll_interval']),
+                name=f'jobs-worker-{number}',
+            )
+            for number in range(options['workers'])
+        ]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+                process.join()
+
+    def print_stats(self):
+        stats = queue.stats()
+        self.stdout.write(
+            'Задач: ' + ', '.join(
+                f'{status} {count}'
+                for status, count in stats['depth'].items())
+        )
+        self.stdout.write(
+            f'Самая старая ждущая задача: {stats["oldest_age"]:.1f} с'
+        )
+        for key, title in (('wait', 'Ожидание'), ('run', 'Выполнение')):
+            values = stats[key]
+            self.stdout.write(
+                f'{title}: p50 {values["p50"]:.3f} с, '
+                f'p95 {values["p95"]:.3f} с, max {values["max"]:.3f} с'
+            )
@@ -0,0 +1,79 @@
+from django.db import models
+from django.utils import timezone
+
+from foodgram.settings import JOBS_MAX_ATTEMPTS
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+STATUSES = (
+    (QUEUED, 'В очереди'),
+    (RUNNING, 'Выполняется'),
+    (DONE, 'Выполнена'),
+    (FAILED, 'Ошибка'),
+)
+
+
+class Job(models.Model):
+    '''Фоновая задача в очереди'''
+    name = models.CharField(
+        'Задача',
+        max_length=100,
+    )
+    payload = models.JSONField(
+        'Аргументы',
+        default=dict,
+    )
+    status = models.CharField(
+        'Статус',
+        max_length=10,
+        choices=STATUSES,
+        default=QUEUED,
+    )
+    attempts = models.PositiveSmallIntegerField(
+        'Попыток',
+        default=0,
+    )
+    max_attempts = models.PositiveSmallIntegerField(
+        'Максимум попыток',
+        default=JOBS_MAX_ATTEMPTS,
+    )
+    run_after = models.DateTimeField(
+        'Выполнить не раньше',
+        default=timezone.now,
+    )
+    locked_until = models.DateTimeField(
+        'Занята воркером до',
+        null=True,
+        blank=True,
+    )
+    created = models.DateTimeField(
+        'Дата постановки',
+        auto_now_add=True,
+    )
+    started = models.DateTimeField(
+        'Дата начала',
+        null=True,
+        blank=True,
+    )
+    finished = models.DateTimeField(
+        'Дата окончания',
+        null=True,
+        blank=True,
+    )
+    last_error = models.TextField(
+        'Последняя ошибка',
+        blank=True,
+    )
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        indexes = (
+            models.Index(fields=('status', 'run_after'),
+                         name='job_status_run_after_idx'),
+        )
+
+    def __str__(self) -> str:
+        return f'{self.name} #{self.pk} ({self.status})'
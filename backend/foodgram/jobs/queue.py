@@ -0,0 +1,180 @@
+"""Очередь фоновых задач в таблице БД.
+
+Задача регистрируется декоратором task в модуле tasks.py своего
+приложения, ставится в очередь через enqueue и выполняется командой
+run_jobs. Строка задачи пишется в той же транзакции, что и изменения,
+которые её породили, поэтому воркер не увидит задачу до коммита,
+а откат отменит и её.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from foodgram.settings import (JOBS_EAGER, JOBS_KEEP_DONE, JOBS_RETRY_DELAY,
+                               JOBS_VISIBILITY_TIMEOUT)
+from jobs.models import DONE, FAILED, QUEUED, RUNNING, Job
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+def task(name):
+    """Зарегистрировать функцию как задачу с именем name."""
+    def decorator(func):
+        if name in registry:
+            raise ValueError(f'Задача {name} уже зарегистрирована.')
+        registry[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, max_attempts=None, delay=0, **payload):
+    """Поставить задачу в очередь. Аргументы должны сериализоваться
+    в JSON."""
+    if name not in registry:
+        raise ValueError(f'Неизвестная задача: {name}')
+    if JOBS_EAGER:
+        transaction.on_commit(lambda: run_eager(name, payload))
+        return None
+    job = Job(
+        name=name,
+        payload=payload,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+    if max_attempts is not None:
+        job.max_attempts = max_attempts
+    job.save()
+    return job
+
+
+def run_eager(name, payload):
+    registry[name](**payload)
+
+
+def available(now):
+    """Задачи, которые можно взять: ждущие в очереди и те, чей воркер
+    не отчитался до конца таймаута видимости."""
+    return Job.objects.filter(
+        Q(status=QUEUED, run_after__lte=now)
+        | Q(status=RUNNING, locked_until__lt=now,
+            attempts__lt=F('max_attempts'))
+    )
+
+
+def claim(limit=1):
+    """Взять до limit задач. Задача достаётся ровно одному воркеру:
+    условный UPDATE сработает только у того, кто первым сменил
+    статус."""
+    now = timezone.now()
+    candidates = available(now).order_by('run_after', 'pk').values(
+        'pk', 'status', 'attempts')[:limit * 4]
+    claimed = []
+    for candidate in candidates:
+        taken = Job.objects.filter(
+            pk=candidate['pk'],
+            status=candidate['status'],
+            attempts=candidate['attempts'],
+        ).update(
+            status=RUNNING,
+            attempts=candidate['attempts'] + 1,
+            started=now,
+            locked_until=now + timedelta(seconds=JOBS_VISIBILITY_TIMEOUT),
+        )
+        if taken:
+            claimed.append(candidate['pk'])
+            if len(claimed) == limit:
+                break
+    return list(Job.objects.filter(pk__in=claimed).order_by('pk'))
+
+
+def execute(job):
+    """Выполнить взятую задачу и записать результат. При ошибке задача
+    возвращается в очередь с экспоненциальной паузой, пока не кончатся
+    попытки."""
+    func = registry.get(job.name)
+    try:
+        if func is None:
+            raise LookupError(f'Неизвестная задача: {job.name}')
+        func(**job.payload)
+    except Exception:
+        now = timezone.now()
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            status, run_after = FAILED, job.run_after
+        else:
+            status = QUEUED
+            run_after = now + timedelta(
+                seconds=JOBS_RETRY_DELAY * 2 ** (job.attempts - 1))
+        Job.objects.filter(pk=job.pk, attempts=job.attempts).update(
+            status=status, run_after=run_after, locked_until=None,
+            finished=now if status == FAILED else None, last_error=error,
+        )
+        logger.warning(
+            'Задача %s #%s: попытка %s из %s не удалась',
+            job.name, job.pk, job.attempts, job.max_attempts, exc_info=True,
+        )
+        return False
+    now = timezone.now()
+    Job.objects.filter(pk=job.pk, attempts=job.attempts).update(
+        status=DONE, finished=now, locked_until=None,
+    )
+    logger.info(
+        'Задача %s #%s: ожидание %.3f с, выполнение %.3f с',
+        job.name, job.pk,
+        (job.started - job.run_after).total_seconds(),
+        (now - job.started).total_seconds(),
+    )
+    return True
+
+
+def purge(keep=JOBS_KEEP_DONE):
+    """Удалить выполненные задачи старше keep секунд и отметить
+    ошибкой зависшие задачи, у которых кончились попытки."""
+    now = timezone.now()
+    Job.objects.filter(
+        status=RUNNING, locked_until__lt=now, attempts__gte=F('max_attempts')
+    ).update(status=FAILED, finished=now, locked_until=None,
+             last_error='Превышен таймаут видимости.')
+    border = now - timedelta(seconds=keep)
+    return Job.objects.filter(status=DONE, finished__lt=border).delete()[0]
+
+
+def stats(recent=1000):
+    """Глубина очереди по статусам, возраст самой старой ждущей задачи
+    и задержки последних recent выполненных задач в секундах."""
+    now = timezone.now()
+    depth = dict(
+        Job.objects.values_list('status').annotate(Count('pk'))
+        .order_by()
+    )
+    oldest = available(now).aggregate(oldest=Min('run_after'))['oldest']
+    finished = list(
+        Job.objects.filter(status=DONE).order_by('-finished').values_list(
+            'run_after', 'started', 'finished')[:recent]
+    )
+    waits = sorted((started - run_after).total_seconds()
+                   for run_after, started, _ in finished)
+    runs = sorted((done - started).total_seconds()
+                  for _, started, done in finished)
+    return {
+        'depth': {status: depth.get(status, 0)
+                  for status in (QUEUED, RUNNING, DONE, FAILED)},
+        'oldest_age': (now - oldest).total_seconds() if oldest else 0.0,
+        'wait': percentiles(waits),
+        'run': percentiles(runs),
+    }
+
+
+def percentiles(ordered):
+    if not ordered:
+        return {'p50': 0.0, 'p95': 0.0, 'max': 0.0}
+    return {
+        'p50': ordered[len(ordered) // 2],
+        'p95': ordered[max(0, int(round(0.95 * len(ordered))) - 1)],
+        'max': ordered[-1],
+    }
@@ -1,64 +1,136 @@
 from django.contrib import admin
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.urls import reverse
+from django.utils.html import format_html
+
+from foodgram.paginators import EstimatedCountPaginator
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                             RecipeTag, ShoppingCart, Tag)
+from recipes.search import update_documents
+
+
+def recipes_count(link):
+    """Число рецептов тега или ингредиента подзапросом: считается только
+    для строк текущей страницы, без GROUP BY по всей таблице."""
+    model = RecipeTag if link == 'tag' else RecipeIngredient
+    return Coalesce(Subquery(
+        model.objects.filter(**{link: OuterRef('pk')}).order_by()
+        .values(link).annotate(total=Count('pk')).values('total')
+    ), Value(0))
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Список большой таблицы: без второго COUNT(*) при фильтрах
+    и с оценкой количества строк без них."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 class RecipeTagInline(admin.TabularInline):
     model = RecipeTag
     extra = 1
+    autocomplete_fields = ('tag', )
+
+    def get_queryset(self, request):
+        # Заголовок строки (__str__) показывает рецепт и тег.
+        return super().get_queryset(request).select_related('recipe', 'tag')
 
 
 class RecipeIngredientsInline(admin.TabularInline):
     model = RecipeIngredient
     extra = 1
+    autocomplete_fields = ('ingredient', )
     list_display = ('amount', )
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'recipe', 'ingredient'
+        )
+
 
 class TagAdmin(admin.ModelAdmin):
-    inlines = [RecipeTagInline]
-    list_display = ('id', 'name', 'color', 'slug')
+    list_display = ('id', 'name', 'color', 'slug', 'recipes')
+    ordering = ('name', )
+    search_fields = ('name', 'slug', )
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            recipes_count=recipes_count('tag')
+        )
+
+    @admin.display(description='Рецепты', ordering='recipes_count')
+    def recipes(self, obj):
+        url = reverse('admin:recipes_recipe_changelist')
+        return format_html('<a href="{}?tags__id__exact={}">{}</a>',
+                           url, obj.pk, obj.recipes_count)
 
 
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(LargeTableAdmin):
     inlines = [RecipeTagInline, RecipeIngredientsInline, ]
-    list_display = ('id', 'name', 'text', 'cooking_time', 'count_favorite', )
+    list_display = ('id', 'name', 'author', 'text', 'cooking_time',
+                    'favorites_count', 'in_carts_count', )
+    list_select_related = ('author', )
     list_filter = ('tags', )
     search_fields = ('name', 'author__username', 'author__email', )
+    autocomplete_fields = ('author', )
 
-    def count_favorite(self, obj):
-        return Favorite.objects.filter(recipe=obj.pk).count()
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        update_documents((form.instance.pk, ))
 
 
-class IngredientAdmin(admin.ModelAdmin):
-    inlines = [RecipeIngredientsInline]
-    list_display = ('id', 'name', 'measurement_unit',)
+class IngredientAdmin(LargeTableAdmin):
+    list_display = ('id', 'name', 'measurement_unit', 'recipes')
+    ordering = ('name', 'measurement_unit')
     list_filter = ('measurement_unit', )
     search_fields = ('name', )
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            recipes_count=recipes_count('ingredient')
+        )
+
+    @admin.display(description='Рецепты', ordering='recipes_count')
+    def recipes(self, obj):
+        # Рецептов у ингредиента может быть сколько угодно, поэтому
+        # вместо встроенной формы — ссылка на постраничный список.
+        url = reverse('admin:recipes_recipeingredient_changelist')
+        return format_html('<a href="{}?ingredient__id__exact={}">{}</a>',
+                           url, obj.pk, obj.recipes_count)
+
 
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(LargeTableAdmin):
     list_display = ('user', 'recipe')
+    list_select_related = ('user', 'recipe')
     list_filter = ('recipe__tags', )
     search_fields = ('user__username', 'user__email', 'recipe__name', )
+    autocomplete_fields = ('user', 'recipe')
 
 
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(LargeTableAdmin):
     list_display = ('user', 'recipe')
+    list_select_related = ('user', 'recipe')
     list_filter = ('recipe__tags', )
     search_fields = ('user__username', 'user__email', 'recipe__name', )
+    autocomplete_fields = ('user', 'recipe')
 
 
-class RecipeIngredientAdmin(admin.ModelAdmin):
+class RecipeIngredientAdmin(LargeTableAdmin):
     list_display = ('recipe', 'ingredient', 'amount', )
+    list_select_related = ('recipe', 'ingredient')
     list_filter = ('recipe__tags', )
     search_fields = (
         'recipe__name', 'recipe__author__username', 'recipe__author__email'
     )
+    autocomplete_fields = ('recipe', 'ingredient')
 
 
-class RecipeTagAdmin(admin.ModelAdmin):
+class RecipeTagAdmin(LargeTableAdmin):
     list_display = ('recipe', 'tag', )
+    list_select_related = ('recipe', 'tag')
     search_fields = ('recipe__name', 'tag__name', )
+    autocomplete_fields = ('recipe', 'tag')
 
 
 admin.site.register(Tag, TagAdmin)
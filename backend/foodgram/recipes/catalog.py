@@ -0,0 +1,122 @@
+"""Версии справочников в БД.
+
+Версия меняется при каждой записи в справочник; процессы сравнивают её
+со своей копией данных и понимают, что копия устарела. Версии лежат
+в таблице, а не в кэше процесса, поэтому запись из воркера фоновых
+задач или из load_ingredients видят все процессы gunicorn. Для больших
+справочников ведётся журнал изменённых id, по которому копию можно
+обновить частично.
+
+Процесс читает версии из БД не чаще раза в CATALOG_VERSION_TTL секунд,
+одним запросом для всех справочников, поэтому автодополнение и 304
+обычно обходятся без БД. Запись из другого процесса становится видна
+не позже чем через CATALOG_VERSION_TTL секунд, запись из этого же
+процесса — сразу.
+"""
+import threading
+import time
+import uuid
+
+from django.db import transaction
+
+from foodgram.settings import CATALOG_VERSION_TTL
+from recipes.models import CatalogChange, CatalogVersion
+
+INGREDIENTS = 'ingredients'
+TAGS = 'tags'
+# Состав рецептов: id рецептов, у которых менялись ингредиенты.
+RECIPE_INGREDIENTS = 'recipe-ingredients'
+# Журнал хранит не меньше стольких последних записей; отставшая копия
+# строится заново.
+CHANGE_LOG_SIZE = 1000
+
+_lock = threading.Lock()
+# Версии, прочитанные процессом, и время чтения по time.monotonic().
+_versions = {}
+_read_at = None
+
+
+def _remember(name, version):
+    with _lock:
+        _versions[name] = version
+
+
+def _new_version():
+    return uuid.uuid4().hex
+
+
+def get_version(name):
+    global _read_at
+    now = time.monotonic()
+    with _lock:
+        fresh = (_read_at is not None
+                 and now - _read_at < CATALOG_VERSION_TTL)
+        version = _versions.get(name) if fresh else None
+    if version is not None:
+        return version
+    versions = dict(CatalogVersion.objects.values_list('name', 'version'))
+    with _lock:
+        _versions.clear()
+        _versions.update(versions)
+        _read_at = now
+    version = versions.get(name)
+    if version is None:
+        version = CatalogVersion.objects.get_or_create(
+            name=name, defaults={'version': _new_version()}
+        )[0].version
+        _remember(name, version)
+    return version
+
+
+def bump_version(name):
+    version = _new_version()
+    if not CatalogVersion.objects.filter(name=name).update(version=version):
+        CatalogVersion.objects.update_or_create(
+            name=name, defaults={'version': version}
+        )
+    _remember(name, version)
+
+
+def get_sequence(name):
+    """Номер последней записи в журнале справочника."""
+    return CatalogVersion.objects.filter(name=name).values_list(
+        'sequence', flat=True).first() or 0
+
+
+def record_changes(name, ids):
+    """Записать изменённые id в журнал и сменить версию справочника."""
+    with transaction.atomic():
+        catalog = CatalogVersion.objects.select_for_update().filter(
+            name=name).first()
+        if catalog is None:
+            catalog = CatalogVersion.objects.get_or_create(
+                name=name, defaults={'version': _new_version()}
+            )[0]
+        catalog.sequence += 1
+        catalog.version = _new_version()
+        catalog.save(update_fields=('sequence', 'version'))
+        _remember(name, catalog.version)
+        CatalogChange.objects.create(
+            catalog=name, sequence=catalog.sequence, ids=sorted(ids)
+        )
+        # Старые записи чистятся раз в CHANGE_LOG_SIZE записей.
+        if catalog.sequence % CHANGE_LOG_SIZE == 0:
+            CatalogChange.objects.filter(
+                catalog=name,
+                sequence__lte=catalog.sequence - CHANGE_LOG_SIZE,
+            ).delete()
+
+
+def get_changes(name, since, until):
+    """id, изменённые после записи since до записи until включительно,
+    или None, если журнал за этот промежуток неполон."""
+    if since is None or until < since or until - since > CHANGE_LOG_SIZE:
+        return None
+    if until == since:
+        return set()
+    found = list(CatalogChange.objects.filter(
+        catalog=name, sequence__gt=since, sequence__lte=until
+    ).values_list('ids', flat=True))
+    if len(found) != until - since:
+        return None
+    return {item for ids in found for item in ids}
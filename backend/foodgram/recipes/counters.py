@@ -0,0 +1,96 @@
+"""Хранимые счётчики рецептов и авторов.
+
+Recipe.favorites_count и in_carts_count, User.recipes_count
+и followers_count меняются одним UPDATE ... SET x = x + n при каждой
+записи (recipes/signals.py), поэтому списки и страницы авторов читают
+их без агрегатов. Расхождения исправляет reconcile_counters.
+"""
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Follow, User
+
+# Сколько строк исправляет один UPDATE.
+RECONCILE_BATCH = 1000
+# (модель, счётчик, связанная модель, поле связи).
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'following'),
+)
+
+# Изменения, накопленные внутри batched(); None вне блока.
+_pending = threading.local()
+
+
+@contextmanager
+def batched():
+    """Копить изменения счётчиков внутри блока и записать их в конце,
+    одним UPDATE на каждую разницу: QuerySet.delete() шлёт сигнал
+    на каждую удалённую строку."""
+    if getattr(_pending, 'deltas', None) is not None:
+        yield
+        return
+    _pending.deltas = deltas = defaultdict(Counter)
+    try:
+        yield
+    finally:
+        _pending.deltas = None
+    for (model, field), changes in deltas.items():
+        adjust_many(model, field, changes)
+
+
+def adjust(model, pks, field, delta):
+    """Изменить счётчик field у строк pks на delta."""
+    if not delta or not pks:
+        return
+    deltas = getattr(_pending, 'deltas', None)
+    if deltas is not None:
+        for pk in pks:
+            deltas[model, field][pk] += delta
+        return
+    model.objects.filter(pk__in=pks).update(**{
+        field: Greatest(F(field) + Value(delta), Value(0))
+    })
+
+
+def adjust_many(model, field, deltas):
+    """Изменить счётчик по словарю {pk: разница}: строки с одинаковой
+    разницей обновляются одним запросом."""
+    by_delta = {}
+    for pk, delta in deltas.items():
+        by_delta.setdefault(delta, []).append(pk)
+    for delta, pks in by_delta.items():
+        adjust(model, pks, field, delta)
+
+
+def live_count(related, link):
+    return Coalesce(Subquery(
+        related.objects.filter(**{link: OuterRef('pk')}).order_by()
+        .values(link).annotate(total=Count('pk')).values('total')
+    ), Value(0))
+
+
+def reconcile(model, field, related, link, fix=True):
+    """Сверить счётчик с настоящим количеством связанных строк.
+    Возвращает [(pk, сохранено, должно быть)]; при fix исправляет."""
+    drifted = list(
+        model.objects.annotate(live=live_count(related, link))
+        .filter(~Q(**{field: F('live')}))
+        .values_list('pk', field, 'live').order_by('pk')
+    )
+    if fix:
+        # Значение пересчитывается в самом UPDATE, а не берётся
+        # из сверки, чтобы не потерять записи, сделанные за это время.
+        pks = [pk for pk, _, _ in drifted]
+        for start in range(0, len(pks), RECONCILE_BATCH):
+            model.objects.filter(
+                pk__in=pks[start:start + RECONCILE_BATCH]
+            ).update(**{field: live_count(related, link)})
+    return drifted
@@ -0,0 +1,111 @@
+"""Лента рецептов авторов, на которых подписан пользователь.
+
+Новый рецепт раскладывается по лентам подписчиков фоновой задачей
+пачками по FEED_BATCH_SIZE. Рецепты авторов, у которых подписчиков
+(User.followers_count) больше FEED_FANOUT_LIMIT, не раскладываются:
+они подмешиваются при чтении запросом по автору. Позиция в ленте —
+пара (дата, id рецепта).
+"""
+import heapq
+from itertools import islice
+
+from django.db.models import Q
+
+from foodgram.settings import (FEED_BACKFILL, FEED_BATCH_SIZE,
+                               FEED_FANOUT_LIMIT)
+from jobs.queue import enqueue
+from recipes.models import FeedItem, Recipe
+from users.models import Follow, User
+
+
+def is_merged_at_read(author_id):
+    return User.objects.filter(
+        pk=author_id, followers_count__gt=FEED_FANOUT_LIMIT).exists()
+
+
+def merged_author_ids(user):
+    """Авторы из подписок user, чьи рецепты подмешиваются при чтении."""
+    return list(user.follower.filter(
+        following__followers_count__gt=FEED_FANOUT_LIMIT
+    ).values_list('following_id', flat=True))
+
+
+def schedule_fan_out(recipe):
+    enqueue('recipes.fan_out', recipe_id=recipe.pk)
+
+
+def fan_out(recipe_id, after=0):
+    """Добавить рецепт в ленты следующей пачки подписчиков автора
+    (подписки с id больше after) и поставить задачу на остальных."""
+    recipe = Recipe.objects.filter(pk=recipe_id).values(
+        'author_id', 'created').first()
+    if recipe is None:
+        return
+    author_id = recipe['author_id']
+    if not after and is_merged_at_read(author_id):
+        return
+    followers = list(
+        Follow.objects.filter(following=author_id, pk__gt=after)
+        .order_by('pk').values_list('pk', 'user_id')[:FEED_BATCH_SIZE]
+    )
+    FeedItem.objects.bulk_create(
+        (FeedItem(user_id=user_id, recipe_id=recipe_id, author_id=author_id,
+                  created=recipe['created'])
+         for _, user_id in followers),
+        ignore_conflicts=True,
+    )
+    if len(followers) == FEED_BATCH_SIZE:
+        enqueue('recipes.fan_out', recipe_id=recipe_id,
+                after=followers[-1][0])
+
+
+def backfill(user_id, author_id):
+    """Последние рецепты автора в ленту нового подписчика."""
+    if is_merged_at_read(author_id):
+        return
+    recipes = Recipe.objects.filter(author_id=author_id).order_by(
+        '-created', '-pk').values_list('pk', 'created')[:FEED_BACKFILL]
+    FeedItem.objects.bulk_create(
+        (FeedItem(user_id=user_id, recipe_id=recipe_id, author_id=author_id,
+                  created=created)
+         for recipe_id, created in recipes),
+        ignore_conflicts=True,
+    )
+
+
+def schedule_backfill(follow):
+    enqueue('recipes.backfill_feed', user_id=follow.user_id,
+            author_id=follow.following_id)
+
+
+def remove_author(user, author_id):
+    FeedItem.objects.filter(user=user, author=author_id).delete()
+
+
+def _before(position, created, pk):
+    if position is None:
+        return Q()
+    return (Q(**{f'{created}__lt': position[0]})
+            | Q(**{created: position[0], f'{pk}__lt': position[1]}))
+
+
+def read(user, count, position=None):
+    """До count позиций ленты (дата, id рецепта) после position,
+    от новых к старым. Разложенные записи и подмешиваемые авторы
+    не пересекаются, поэтому источники просто сливаются."""
+    authors = merged_author_ids(user)
+    sources = [
+        FeedItem.objects.filter(user=user)
+        .exclude(author_id__in=authors)
+        .filter(_before(position, 'created', 'recipe_id'))
+        .order_by('-created', '-recipe_id')
+        .values_list('created', 'recipe_id')[:count]
+    ]
+    if authors:
+        sources.append(
+            Recipe.objects.filter(author_id__in=authors)
+            .filter(_before(position, 'created', 'pk'))
+            .order_by('-created', '-pk')
+            .values_list('created', 'pk')[:count]
+        )
+    return list(islice(heapq.merge(*sources, reverse=True), count))
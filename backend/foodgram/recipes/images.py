@@ -0,0 +1,61 @@
+"""Уменьшенные копии картинок рецептов.
+
+Копии строит фоновая задача recipes.build_renditions (см. tasks.py),
+чтобы запрос на создание или изменение рецепта не ждал обработки
+картинки.
+"""
+import io
+import os
+
+from django.core.files.base import ContentFile
+from django.dispatch import Signal
+from PIL import Image, ImageOps
+
+from foodgram.settings import IMAGE_RENDITION_FORMAT, IMAGE_RENDITIONS
+from jobs.queue import enqueue
+from recipes.models import Recipe
+
+# Копии картинки рецепта записаны в БД; аргумент recipe_id. Запись идёт
+# через update(), который не шлёт post_save, поэтому слушателям (кэш
+# выдачи в api/signals.py) нужен отдельный сигнал.
+renditions_built = Signal()
+
+
+def render(image, size):
+    """Вписать картинку в size и закодировать в IMAGE_RENDITION_FORMAT."""
+    copy = image.copy()
+    copy.thumbnail(size, Image.LANCZOS)
+    if IMAGE_RENDITION_FORMAT == 'JPEG' and copy.mode != 'RGB':
+        copy = copy.convert('RGB')
+    buffer = io.BytesIO()
+    copy.save(buffer, format=IMAGE_RENDITION_FORMAT, quality=80)
+    return buffer.getvalue()
+
+
+def build_renditions(recipe_id):
+    """Построить копии для рецепта и сохранить их, если картинка
+    не сменилась за время обработки."""
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None or not recipe.image:
+        return
+    source = recipe.image.name
+    base = os.path.splitext(os.path.basename(source))[0]
+    extension = IMAGE_RENDITION_FORMAT.lower()
+    with recipe.image.open('rb') as file, Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        for field, size in IMAGE_RENDITIONS.items():
+            getattr(recipe, field).save(
+                f'{base}_{field}.{extension}',
+                ContentFile(render(image, size)),
+                save=False,
+            )
+    updated = Recipe.objects.filter(pk=recipe_id, image=source).update(**{
+        field: getattr(recipe, field).name for field in IMAGE_RENDITIONS
+    })
+    if updated:
+        renditions_built.send(sender=Recipe, recipe_id=recipe_id)
+
+
+def schedule_renditions(recipe):
+    """Поставить построение копий в очередь фоновых задач."""
+    enqueue('recipes.build_renditions', recipe_id=recipe.pk)
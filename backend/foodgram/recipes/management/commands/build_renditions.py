@@ -0,0 +1,24 @@
+from django.core.management import BaseCommand
+
+from recipes.images import build_renditions
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Построить уменьшенные копии картинок рецептов, у которых их нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Перестроить копии для всех рецептов'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.all()
+        if not options['all']:
+            recipes = recipes.filter(image_card='')
+        count = 0
+        for recipe_id in recipes.values_list('pk', flat=True).iterator():
+            build_renditions(recipe_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Обработано рецептов: {count}'))
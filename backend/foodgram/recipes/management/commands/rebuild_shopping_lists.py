@@ -0,0 +1,54 @@
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобрать сводные списки покупок или сверить их '
+        'с суммой по рецептам в списках покупок'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сверить, ничего не меняя'
+        )
+        parser.add_argument(
+            '--user', type=int, nargs='*', dest='user_ids',
+            help='id пользователей; по умолчанию все'
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+        if options['check']:
+            self.check_totals(user_ids)
+            return
+        with transaction.atomic():
+            count = ShoppingListItem.objects.rebuild(user_ids)
+        self.stdout.write(self.style.SUCCESS(f'Записано строк: {count}'))
+
+    def check_totals(self, user_ids):
+        live = ShoppingListItem.objects.live_totals(user_ids)
+        rows = ShoppingListItem.objects.all()
+        if user_ids is not None:
+            rows = rows.filter(user_id__in=user_ids)
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in rows.values_list(
+                'user_id', 'ingredient_id', 'amount').iterator()
+        }
+        mismatches = [
+            (key, stored.get(key), live.get(key))
+            for key in stored.keys() | live.keys()
+            if stored.get(key) != live.get(key)
+        ]
+        for (user_id, ingredient_id), saved, expected in sorted(mismatches):
+            self.stdout.write(
+                f'user={user_id} ingredient={ingredient_id}: '
+                f'сохранено {saved}, должно быть {expected}'
+            )
+        if mismatches:
+            raise CommandError(f'Расхождений: {len(mismatches)}')
+        self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
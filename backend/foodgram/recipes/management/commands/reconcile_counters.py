@@ -0,0 +1,36 @@
+from django.core.management import BaseCommand, CommandError
+
+from recipes.counters import COUNTERS, reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверить счётчики избранного, списков покупок, рецептов '
+        'и подписчиков с настоящими данными и исправить расхождения'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сверить, ничего не меняя'
+        )
+
+    def handle(self, *args, **options):
+        fix = not options['check']
+        total = 0
+        for model, field, related, link in COUNTERS:
+            drifted = reconcile(model, field, related, link, fix=fix)
+            for pk, saved, expected in drifted:
+                self.stdout.write(
+                    f'{model._meta.model_name}={pk} {field}: '
+                    f'сохранено {saved}, должно быть {expected}'
+                )
+            total += len(drifted)
+        if not total:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
+        elif fix:
+            self.stdout.write(self.style.SUCCESS(
+                f'Исправлено расхождений: {total}'
+            ))
+        else:
+            raise CommandError(f'Расхождений: {total}')
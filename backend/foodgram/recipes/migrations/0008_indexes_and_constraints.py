@@ -0,0 +1,65 @@
+# Generated by Django 4.2.1 on 2026-10-18 18:54
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+TRIGRAM_INDEX = 'ingredient_name_trgm_idx'
+
+
+def remove_duplicates(apps, schema_editor):
+    """Перед уникальными ограничениями оставить по одной строке на
+    пару рецепт-тэг и рецепт-ингредиент."""
+    for model_name, field in (('RecipeTag', 'tag'),
+                              ('RecipeIngredient', 'ingredient')):
+        model = apps.get_model('recipes', model_name)
+        duplicates = model.objects.values('recipe', field).annotate(
+            first=Min('id'), total=Count('id')
+        ).filter(total__gt=1)
+        for row in duplicates.iterator():
+            model.objects.filter(
+                recipe=row['recipe'], **{field: row[field]}
+            ).exclude(id=row['first']).delete()
+
+
+def create_trigram_index(apps, schema_editor):
+    """Триграммный индекс для icontains по названию, только Postgres."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {TRIGRAM_INDEX} ON recipes_ingredient '
+        f'USING gin (UPPER(name::text) gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {TRIGRAM_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['name'], name='ingredient_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-created', '-id'], name='recipe_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='recipeingredient',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), name='unique_recipe_ingredient'),
+        ),
+        migrations.AddConstraint(
+            model_name='recipetag',
+            constraint=models.UniqueConstraint(fields=('recipe', 'tag'), name='unique_recipe_tag'),
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
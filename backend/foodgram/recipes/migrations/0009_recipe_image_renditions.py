@@ -0,0 +1,23 @@
+# Generated by Django 4.2.1 on 2026-10-18 18:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_indexes_and_constraints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_card',
+            field=models.ImageField(blank=True, editable=False, upload_to='recipes/renditions/', verbose_name='Картинка для карточки'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_thumbnail',
+            field=models.ImageField(blank=True, editable=False, upload_to='recipes/renditions/', verbose_name='Миниатюра картинки'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.1 on 2026-10-18 18:59
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicates(apps, schema_editor):
+    """Перед уникальным ограничением оставить по одному ингредиенту
+    на пару название-единица. Ссылки из рецептов и списков покупок
+    переносятся на оставшийся ингредиент, количества складываются."""
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    duplicates = Ingredient.objects.values('name', 'measurement_unit').annotate(
+        first=Min('id'), total=Count('id')
+    ).filter(total__gt=1)
+    for row in duplicates.iterator():
+        extra = list(
+            Ingredient.objects.filter(
+                name=row['name'], measurement_unit=row['measurement_unit']
+            ).exclude(id=row['first']).values_list('id', flat=True)
+        )
+        for model_name, owner in (('RecipeIngredient', 'recipe'),
+                                  ('ShoppingListItem', 'user')):
+            model = apps.get_model('recipes', model_name)
+            for item in model.objects.filter(ingredient_id__in=extra):
+                kept = model.objects.filter(
+                    ingredient_id=row['first'],
+                    **{owner: getattr(item, f'{owner}_id')}
+                ).first()
+                if kept is None:
+                    item.ingredient_id = row['first']
+                    item.save(update_fields=('ingredient', ))
+                else:
+                    kept.amount += item.amount
+                    kept.save(update_fields=('amount', ))
+                    item.delete()
+        Ingredient.objects.filter(id__in=extra).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_image_renditions'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='ingredient',
+            name='ingredient_name_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.1 on 2026-10-18 19:04
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+SEARCH_VECTOR_INDEX = 'recipe_search_vector_idx'
+NAME_TRIGRAM_INDEX = 'recipe_name_trgm_idx'
+
+
+def fill_documents(apps, schema_editor):
+    """Поисковый документ существующих рецептов."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    names = defaultdict(list)
+    for recipe_id, name in RecipeIngredient.objects.values_list(
+            'recipe_id', 'ingredient__name').iterator():
+        names[recipe_id].append(name)
+    recipes = []
+    for recipe in Recipe.objects.select_related('author').iterator():
+        author = recipe.author
+        recipe.search_document = ' '.join((
+            recipe.name, author.first_name, author.last_name,
+            author.username, *sorted(names[recipe.pk]), recipe.text,
+        )).casefold()
+        recipes.append(recipe)
+    Recipe.objects.bulk_update(recipes, ('search_document', ),
+                               batch_size=500)
+
+
+def create_search_vector(apps, schema_editor):
+    """Генерируемая колонка tsvector и индексы поиска, только Postgres."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        "ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector "
+        "GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('russian', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('russian', coalesce(search_document, '')), "
+        "'C')"
+        ") STORED"
+    )
+    schema_editor.execute(
+        f'CREATE INDEX {SEARCH_VECTOR_INDEX} ON recipes_recipe '
+        f'USING gin (search_vector)'
+    )
+    schema_editor.execute(
+        f'CREATE INDEX {NAME_TRIGRAM_INDEX} ON recipes_recipe '
+        f'USING gin (name gin_trgm_ops)'
+    )
+
+
+def drop_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {NAME_TRIGRAM_INDEX}')
+    schema_editor.execute(
+        'ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_unique_ingredient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_document',
+            field=models.TextField(blank=True, editable=False, verbose_name='Текст для поиска'),
+        ),
+        migrations.RunPython(fill_documents, migrations.RunPython.noop),
+        migrations.RunPython(create_search_vector, drop_search_vector),
+    ]
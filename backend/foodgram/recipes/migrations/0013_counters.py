@@ -0,0 +1,52 @@
+# Generated by Django 4.2.1 on 2026-10-18 19:13
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+# (модель, счётчик, связанная модель, поле связи).
+COUNTERS = (
+    ('recipes.Recipe', 'favorites_count', 'recipes.Favorite', 'recipe'),
+    ('recipes.Recipe', 'in_carts_count', 'recipes.ShoppingCart', 'recipe'),
+    ('users.User', 'recipes_count', 'recipes.Recipe', 'author'),
+    ('users.User', 'followers_count', 'users.Follow', 'following'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    """Счётчики существующих рецептов и пользователей."""
+    for model, field, related, link in COUNTERS:
+        related = apps.get_model(related)
+        apps.get_model(model).objects.update(**{field: Coalesce(
+            Subquery(
+                related.objects.filter(**{link: OuterRef('pk')}).order_by()
+                .values(link).annotate(total=Count('pk')).values('total')
+            ),
+            Value(0),
+        )})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_feeditem'),
+        ('users', '0003_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-id'], name='recipe_favorites_count_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
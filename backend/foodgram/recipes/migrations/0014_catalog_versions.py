@@ -0,0 +1,42 @@
+# Generated by Django 4.2.1 on 2026-10-18 19:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('catalog', models.CharField(max_length=50, verbose_name='Справочник')),
+                ('sequence', models.PositiveBigIntegerField(verbose_name='Номер записи')),
+                ('ids', models.JSONField(verbose_name='Изменённые id')),
+            ],
+            options={
+                'verbose_name': 'Изменение справочника',
+                'verbose_name_plural': 'Журнал изменений справочников',
+            },
+        ),
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='Справочник')),
+                ('version', models.CharField(max_length=32, verbose_name='Версия')),
+                ('sequence', models.PositiveBigIntegerField(default=0, verbose_name='Последняя запись журнала')),
+            ],
+            options={
+                'verbose_name': 'Версия справочника',
+                'verbose_name_plural': 'Версии справочников',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='catalogchange',
+            constraint=models.UniqueConstraint(fields=('catalog', 'sequence'), name='unique_catalog_change'),
+        ),
+    ]
@@ -1,7 +1,14 @@
-from django.db import models
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.db import connections, models
+from django.db.models import (Case, Exists, F, IntegerField, OuterRef,
+                              Prefetch, Sum, Value, When, Window)
+from django.db.models.functions import Greatest, RowNumber
 from django.core.validators import MinValueValidator
 
-from users.models import User
+from users.models import CountersMixin, Follow, User
 from foodgram.settings import AMOUNT_MIN, MIN_VALUE
 
 
@@ -23,6 +30,14 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        # Индекс ограничения начинается с name и заменяет отдельный
+        # индекс по названию.
+        constraints = (
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient',
+            ),
+        )
 
     def __str__(self) -> str:
         return self.name
@@ -61,7 +76,67 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+def recipe_prefetches():
+    """Теги и ингредиенты с количеством для выдачи рецепта."""
+    return (
+        'tags',
+        Prefetch(
+            'recipeingredient_set',
+            queryset=RecipeIngredient.objects.select_related('ingredient'),
+        ),
+    )
+
+
+class RecipeQuerySet(models.QuerySet):
+    '''Запросы для выдачи рецептов'''
+
+    def with_related(self):
+        """Автор, теги и ингредиенты с количеством за фиксированное
+        число запросов."""
+        return self.select_related('author').prefetch_related(
+            *recipe_prefetches()
+        )
+
+    def with_user_flags(self, user):
+        """Флаги избранного, списка покупок и подписки на автора
+        для пользователя user."""
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+                is_author_subscribed=Value(False),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_author_subscribed=Exists(Follow.objects.filter(
+                user=user, following=OuterRef('author')
+            )),
+        )
+
+    def first_per_author(self, author_ids, limit=None):
+        """Не больше limit последних рецептов каждого автора одним
+        запросом: {id автора: [рецепты]}."""
+        recipes = self.filter(author_id__in=author_ids)
+        ordering = (F('created').desc(), F('pk').desc())
+        if (limit is not None
+                and connections[self.db].features.supports_over_clause):
+            recipes = recipes.annotate(row_number=Window(
+                RowNumber(), partition_by=F('author_id'), order_by=ordering
+            )).filter(row_number__lte=limit)
+        by_author = defaultdict(list)
+        for recipe in recipes.order_by(*ordering):
+            author_recipes = by_author[recipe.author_id]
+            if limit is None or len(author_recipes) < limit:
+                author_recipes.append(recipe)
+        return by_author
+
+
+class Recipe(CountersMixin, models.Model):
     '''Класс рецептов'''
     author = models.ForeignKey(
         User,
@@ -96,6 +171,18 @@ class Recipe(models.Model):
         blank=False,
         null=False,
     )
+    image_thumbnail = models.ImageField(
+        'Миниатюра картинки',
+        upload_to='recipes/renditions/',
+        blank=True,
+        editable=False,
+    )
+    image_card = models.ImageField(
+        'Картинка для карточки',
+        upload_to='recipes/renditions/',
+        blank=True,
+        editable=False,
+    )
     text = models.TextField(
         'Описание рецепта',
         max_length=255,
@@ -112,10 +199,38 @@ class Recipe(models.Model):
         'Дата создания рецепта',
         auto_now_add=True
     )
+    search_document = models.TextField(
+        'Текст для поиска',
+        blank=True,
+        editable=False,
+    )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        'В списках покупок',
+        default=0,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
+    counters = ('favorites_count', 'in_carts_count')
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = (
+            models.Index(
+                fields=('-created', '-id'), name='recipe_created_idx'
+            ),
+            models.Index(
+                fields=('-favorites_count', '-id'),
+                name='recipe_favorites_count_idx'
+            ),
+        )
 
     def __str__(self) -> str:
         return self.name
@@ -135,6 +250,11 @@ class RecipeTag(models.Model):
     class Meta:
         verbose_name = 'Рецепт-тэг'
         verbose_name_plural = 'Рецепты-тэги'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'tag'), name='unique_recipe_tag'
+            ),
+        )
 
     def __str__(self) -> str:
         return f'У {self.recipe} тэги: {self.tag}'
@@ -161,6 +281,12 @@ class RecipeIngredient(models.Model):
     class Meta:
         verbose_name = 'Рецепт-ингредиент'
         verbose_name_plural = 'Рецепты-ингредиенты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'ingredient'),
+                name='unique_recipe_ingredient'
+            ),
+        )
 
     def __str__(self) -> str:
         return f'У {self.recipe} ингредиенты: {self.ingredient}'
@@ -216,3 +342,248 @@ class ShoppingCart(models.Model):
 
     def __str__(self) -> str:
         return f'{self.user} добавил в список покупок {self.recipe}.'
+
+
+# Изменения рецептов, накопленные внутри ShoppingListItemManager.batched();
+# None вне блока.
+_pending_changes = threading.local()
+
+
+class ShoppingListItemManager(models.Manager):
+    '''Поддержка сводного списка покупок в актуальном состоянии'''
+
+    def add_recipes(self, user, recipe_ids, sign=1):
+        """Добавить к списку пользователя ингредиенты рецептов."""
+        deltas = {
+            row['ingredient_id']: sign * row['total']
+            for row in RecipeIngredient.objects.filter(
+                recipe_id__in=recipe_ids
+            ).values('ingredient_id').annotate(total=Sum('amount'))
+        }
+        self.apply(deltas, (user.pk, ))
+
+    def remove_recipes(self, user, recipe_ids):
+        """Вычесть из списка пользователя ингредиенты рецептов."""
+        self.add_recipes(user, recipe_ids, sign=-1)
+
+    @contextmanager
+    def batched(self):
+        """Копить изменения рецептов внутри блока и применить их в конце,
+        по одному разу на рецепт: удаление строк состава шлёт сигнал
+        на каждую строку (recipes/signals.py)."""
+        if getattr(_pending_changes, 'recipes', None) is not None:
+            yield
+            return
+        _pending_changes.recipes = recipes = defaultdict(Counter)
+        try:
+            yield
+        finally:
+            _pending_changes.recipes = None
+        for recipe, deltas in recipes.items():
+            self.apply_recipe_change(recipe, deltas)
+
+    def apply_recipe_change(self, recipe, deltas):
+        """Применить изменение ингредиентов рецепта (объект или id)
+        {id: разница} ко всем пользователям, у которых он в списке
+        покупок."""
+        recipe_id = getattr(recipe, 'pk', recipe)
+        pending = getattr(_pending_changes, 'recipes', None)
+        if pending is not None:
+            pending[recipe_id].update(deltas)
+            return
+        if any(deltas.values()):
+            self.apply(deltas, ShoppingCart.objects.filter(
+                recipe_id=recipe_id).values_list('user_id', flat=True))
+
+    def apply(self, deltas, user_ids):
+        """Изменить суммы пользователей user_ids на
+        deltas {id ингредиента: разница} одним UPDATE."""
+        deltas = {key: value for key, value in deltas.items() if value}
+        user_ids = list(user_ids)
+        if not deltas or not user_ids:
+            return
+        added = [key for key, value in deltas.items() if value > 0]
+        self.bulk_create(
+            (
+                self.model(user_id=user_id, ingredient_id=ingredient_id,
+                           amount=0)
+                for user_id in user_ids
+                for ingredient_id in added
+            ),
+            ignore_conflicts=True,
+        )
+        rows = self.filter(user_id__in=user_ids, ingredient_id__in=deltas)
+        rows.update(amount=Greatest(
+            F('amount') + Case(
+                *(When(ingredient_id=key, then=Value(value))
+                  for key, value in deltas.items()),
+                default=Value(0),
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        ))
+        rows.filter(amount=0).delete()
+
+    def live_totals(self, user_ids=None):
+        """Суммы, посчитанные заново по спискам покупок."""
+        # Одно условие filter(): второй filter() по многозначной связи
+        # добавил бы ещё одно соединение с ShoppingCart и умножил суммы
+        # на число корзин с тем же рецептом.
+        if user_ids is None:
+            condition = {'recipe__shopping_cart__isnull': False}
+        else:
+            condition = {'recipe__shopping_cart__user_id__in': user_ids}
+        rows = RecipeIngredient.objects.filter(**condition)
+        return {
+            (row['recipe__shopping_cart__user'],
+             row['ingredient_id']): row['total']
+            for row in rows.values(
+                'recipe__shopping_cart__user', 'ingredient_id'
+            ).annotate(total=Sum('amount')).iterator()
+        }
+
+    def rebuild(self, user_ids=None):
+        """Пересобрать сводные списки с нуля."""
+        totals = self.live_totals(user_ids)
+        rows = self.all()
+        if user_ids is not None:
+            rows = rows.filter(user_id__in=user_ids)
+        rows.delete()
+        self.bulk_create(
+            (
+                self.model(user_id=user_id, ingredient_id=ingredient_id,
+                           amount=amount)
+                for (user_id, ingredient_id), amount in totals.items()
+            ),
+            batch_size=1000,
+        )
+        return len(totals)
+
+
+class ShoppingListItem(models.Model):
+    '''Сводный список покупок: сумма ингредиента по рецептам в списке
+    покупок пользователя'''
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+    )
+    amount = models.PositiveIntegerField(
+        'Количество',
+        default=0,
+    )
+
+    objects = ShoppingListItemManager()
+
+    class Meta:
+        verbose_name = 'Сводный список покупок'
+        verbose_name_plural = 'Сводные списки покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item'
+            ),
+        )
+
+    def __str__(self) -> str:
+        return f'{self.user}: {self.ingredient} {self.amount}'
+
+
+class FeedItem(models.Model):
+    '''Лента: рецепт автора, на которого подписан пользователь.
+    Строки раскладываются фоновой задачей при публикации рецепта'''
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    created = models.DateTimeField(
+        'Дата создания рецепта',
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_item'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-created', '-recipe'),
+                name='feed_item_user_created_idx'
+            ),
+            models.Index(
+                fields=('user', 'author'), name='feed_item_user_author_idx'
+            ),
+        )
+
+    def __str__(self) -> str:
+        return f'{self.user}: {self.recipe}'
+
+
+class CatalogVersion(models.Model):
+    '''Версия справочника и номер последней записи в его журнале
+    изменений (recipes/catalog.py). Хранится в БД, чтобы запись
+    из любого процесса была видна всем остальным'''
+    name = models.CharField(
+        'Справочник',
+        max_length=50,
+        primary_key=True,
+    )
+    version = models.CharField(
+        'Версия',
+        max_length=32,
+    )
+    sequence = models.PositiveBigIntegerField(
+        'Последняя запись журнала',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Версия справочника'
+        verbose_name_plural = 'Версии справочников'
+
+    def __str__(self):
+        return f'{self.name}: {self.version}'
+
+
+class CatalogChange(models.Model):
+    '''Запись журнала изменений справочника: id изменённых строк'''
+    catalog = models.CharField(
+        'Справочник',
+        max_length=50,
+    )
+    sequence = models.PositiveBigIntegerField(
+        'Номер записи',
+    )
+    ids = models.JSONField(
+        'Изменённые id',
+    )
+
+    class Meta:
+        verbose_name = 'Изменение справочника'
+        verbose_name_plural = 'Журнал изменений справочников'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('catalog', 'sequence'),
+                name='unique_catalog_change'
+            ),
+        )
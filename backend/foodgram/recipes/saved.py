@@ -0,0 +1,67 @@
+"""Избранное и список покупок: добавление и удаление пачкой рецептов.
+
+На время записи строка пользователя блокируется, поэтому параллельные
+запросы одного пользователя сходятся в том, какие рецепты уже есть,
+а счётчики рецептов (recipes/counters.py) и сводный список покупок
+меняются ровно на добавленные и убранные рецепты.
+"""
+from django.db import transaction
+
+from recipes import counters
+from recipes.models import Favorite, Recipe, ShoppingCart, ShoppingListItem
+from users.models import User
+
+COUNTER_FIELDS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'in_carts_count',
+}
+
+
+def _lock(user):
+    list(User.objects.select_for_update().filter(
+        pk=user.pk).values_list('pk'))
+
+
+def add(model, user, recipe_ids):
+    """Добавить рецепты в избранное или список покупок (model).
+    Возвращает id рецептов, которых там ещё не было."""
+    recipe_ids = set(recipe_ids)
+    with transaction.atomic():
+        _lock(user)
+        added = recipe_ids - set(model.objects.filter(
+            user=user, recipe_id__in=recipe_ids
+        ).values_list('recipe_id', flat=True))
+        if not added:
+            return added
+        model.objects.bulk_create(
+            (model(user=user, recipe_id=recipe_id) for recipe_id in added),
+            ignore_conflicts=True,
+        )
+        counters.adjust(Recipe, added, COUNTER_FIELDS[model], 1)
+        if model is ShoppingCart:
+            ShoppingListItem.objects.add_recipes(user, added)
+    return added
+
+
+def remove(model, user, recipe_ids=None):
+    """Убрать рецепты из избранного или списка покупок (model); все,
+    если recipe_ids не задан. Возвращает id убранных рецептов."""
+    with transaction.atomic():
+        _lock(user)
+        rows = model.objects.filter(user=user)
+        if recipe_ids is not None:
+            rows = rows.filter(recipe_id__in=set(recipe_ids))
+        removed = set(rows.values_list('recipe_id', flat=True))
+        if not removed:
+            return removed
+        # Счётчики рецептов уменьшает сигнал post_delete
+        # (recipes/signals.py), все вместе после удаления.
+        with counters.batched():
+            rows.delete()
+        if model is not ShoppingCart:
+            return removed
+        if recipe_ids is None:
+            ShoppingListItem.objects.filter(user=user).delete()
+        else:
+            ShoppingListItem.objects.remove_recipes(user, removed)
+    return removed
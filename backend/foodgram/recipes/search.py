@@ -0,0 +1,101 @@
+"""Полнотекстовый поиск рецептов.
+
+В Recipe.search_document хранится приведённый к нижнему регистру текст
+рецепта: название, автор, ингредиенты и описание, чтобы искать по одной
+таблице без соединений. На Postgres из названия и этого поля собирается
+хранимая генерируемая колонка search_vector (tsvector) с GIN-индексом,
+опечатки в названии ловит триграммный индекс. На остальных БД ищутся
+вхождения слов в search_document: регистр приведён заранее, потому что
+LIKE в SQLite не различает регистр только для латиницы.
+"""
+from collections import defaultdict
+
+from django.contrib.postgres.lookups import TrigramWordSimilar
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVectorField,
+                                            TrigramWordSimilarity)
+from django.db import connections
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+from jobs.queue import enqueue
+from recipes.models import Recipe, RecipeIngredient
+
+SEARCH_CONFIG = 'russian'
+# Больше слов в запросе не учитывается.
+MAX_TERMS = 8
+# Сколько рецептов пересчитывает одна фоновая задача.
+UPDATE_BATCH = 500
+
+
+def make_document(name, text, author, ingredient_names):
+    return ' '.join((
+        name, author.first_name, author.last_name, author.username,
+        *sorted(ingredient_names), text,
+    )).casefold()
+
+
+def update_documents(recipe_ids):
+    """Пересчитать search_document у рецептов recipe_ids."""
+    names = defaultdict(list)
+    for recipe_id, name in RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids).values_list(
+                'recipe_id', 'ingredient__name'):
+        names[recipe_id].append(name)
+    recipes = list(
+        Recipe.objects.filter(pk__in=recipe_ids).select_related(
+            'author').only('name', 'text', 'search_document',
+                           'author__first_name', 'author__last_name',
+                           'author__username')
+    )
+    for recipe in recipes:
+        recipe.search_document = make_document(
+            recipe.name, recipe.text, recipe.author, names[recipe.pk]
+        )
+    Recipe.objects.bulk_update(recipes, ('search_document', ))
+    return len(recipes)
+
+
+def schedule_update(recipe_ids):
+    """Пересчитать search_document в фоне, пачками по UPDATE_BATCH."""
+    recipe_ids = sorted(set(recipe_ids))
+    for start in range(0, len(recipe_ids), UPDATE_BATCH):
+        enqueue('recipes.update_search',
+                recipe_ids=recipe_ids[start:start + UPDATE_BATCH])
+
+
+def search(queryset, text):
+    """Рецепты, подходящие под text, с оценкой релевантности rank."""
+    text = text.strip()
+    if not text:
+        return queryset
+    if connections[queryset.db].vendor == 'postgresql':
+        return _search_postgres(queryset, text)
+    return _search_fallback(queryset, text)
+
+
+def _search_postgres(queryset, text):
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+    vector = RawSQL(
+        f'{Recipe._meta.db_table}.search_vector', (),
+        output_field=SearchVectorField(),
+    )
+    return queryset.alias(search_vector=vector).annotate(
+        rank=SearchRank(F('search_vector'), query)
+        + TrigramWordSimilarity(Value(text), 'name')
+    ).filter(
+        Q(search_vector=query) | Q(TrigramWordSimilar(F('name'), text))
+    )
+
+
+def _search_fallback(queryset, text):
+    """Все слова запроса должны встретиться в рецепте; совпадение
+    в названии весит больше."""
+    rank = Value(0)
+    for term in text.casefold().split()[:MAX_TERMS]:
+        queryset = queryset.filter(search_document__contains=term)
+        in_name = (Q(name__icontains=term)
+                   | Q(name__contains=term.capitalize()))
+        rank += Case(When(in_name, then=Value(2)),
+                     default=Value(1), output_field=IntegerField())
+    return queryset.annotate(rank=rank)
@@ -0,0 +1,118 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from recipes import counters
+from recipes.catalog import (INGREDIENTS, RECIPE_INGREDIENTS, TAGS,
+                             bump_version, record_changes)
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingListItem, Tag)
+from recipes.search import schedule_update
+from users.models import Follow, User
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredients_changed(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version(INGREDIENTS))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tags_changed(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version(TAGS))
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def recipe_ingredients_changed(sender, instance, **kwargs):
+    recipe_id = instance.recipe_id
+    transaction.on_commit(
+        lambda: record_changes(RECIPE_INGREDIENTS, (recipe_id, ))
+    )
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    """Вычесть ингредиенты удаляемого рецепта из списков покупок, пока
+    строки корзин и состава ещё на месте."""
+    ShoppingListItem.objects.apply_recipe_change(instance, {
+        ingredient_id: -amount
+        for ingredient_id, amount in RecipeIngredient.objects.filter(
+            recipe=instance).values_list('ingredient_id', 'amount')
+    })
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def recipe_ingredient_saving(sender, instance, raw=False, **kwargs):
+    # Прежнее значение строки, чтобы после записи применить разницу.
+    instance.previous_row = None
+    if instance.pk is not None and not raw:
+        instance.previous_row = RecipeIngredient.objects.filter(
+            pk=instance.pk).values_list('ingredient_id', 'amount').first()
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def recipe_ingredient_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    deltas = Counter({instance.ingredient_id: instance.amount})
+    previous = getattr(instance, 'previous_row', None)
+    if previous is not None:
+        deltas[previous[0]] -= previous[1]
+    ShoppingListItem.objects.apply_recipe_change(instance.recipe_id, deltas)
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_deleted(sender, instance, origin=None, **kwargs):
+    # Строки удалённого рецепта (или его автора) учёл recipe_deleted,
+    # а при удалении ингредиента строки списков удаляются каскадом.
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if model is RecipeIngredient:
+        ShoppingListItem.objects.apply_recipe_change(
+            instance.recipe_id, {instance.ingredient_id: -instance.amount}
+        )
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_renamed(sender, instance, created, **kwargs):
+    if not created:
+        schedule_update(RecipeIngredient.objects.filter(
+            ingredient=instance).values_list('recipe_id', flat=True))
+
+
+@receiver(post_save, sender=User)
+def author_renamed(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None
+                   and set(update_fields) <= {'last_login'}):
+        return
+    schedule_update(instance.recipes.values_list('pk', flat=True))
+
+
+def _count(sender, instance, delta, origin=None):
+    """Изменить счётчики строк, на которые ссылается instance. При
+    каскадном удалении самой этой строки обновлять нечего."""
+    for model, field, related, link in counters.COUNTERS:
+        if related is not sender:
+            continue
+        pk = getattr(instance, f'{link}_id')
+        if not (isinstance(origin, model) and origin.pk == pk):
+            counters.adjust(model, (pk, ), field, delta)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Follow)
+def counted_created(sender, instance, created, **kwargs):
+    if created:
+        _count(sender, instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Follow)
+def counted_deleted(sender, instance, origin=None, **kwargs):
+    _count(sender, instance, -1, origin)
@@ -0,0 +1,9 @@
+from jobs.queue import task
+from recipes.feed import backfill, fan_out
+from recipes.images import build_renditions
+from recipes.search import update_documents
+
+task('recipes.build_renditions')(build_renditions)
+task('recipes.update_search')(update_documents)
+task('recipes.fan_out')(fan_out)
+task('recipes.backfill_feed')(backfill)
@@ -0,0 +1,69 @@
+from datetime import datetime, timezone
+
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe
+from users.models import User
+
+CREATED = datetime(2023, 6, 4, 17, 26, tzinfo=timezone.utc)
+
+
+class RecipeCursorPaginationTest(TestCase):
+    """Курсорная пагинация рецептов с одинаковой датой создания."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author',
+                                         email='author@example.com')
+        for number in range(7):
+            cls.add_recipe(number)
+        Recipe.objects.filter(name='рецепт 6').update(
+            created=datetime(2023, 6, 5, tzinfo=timezone.utc)
+        )
+
+    @classmethod
+    def add_recipe(cls, number):
+        """Рецепт с общей датой создания: created заполняется при
+        сохранении, поэтому дата выставляется отдельным UPDATE."""
+        recipe = Recipe.objects.create(
+            author=cls.author, name=f'рецепт {number}',
+            image='recipes/images/x.jpg', text='Описание', cooking_time=10,
+        )
+        Recipe.objects.filter(pk=recipe.pk).update(created=CREATED)
+
+    def page_through(self, between_pages=None):
+        client = APIClient()
+        url = '/api/recipes/?pagination=cursor&limit=3'
+        ids = []
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+            if between_pages:
+                between_pages()
+                between_pages = None
+        return ids
+
+    def test_equal_timestamps_are_paged_once(self):
+        expected = list(
+            Recipe.objects.order_by('-created', '-pk')
+            .values_list('pk', flat=True)
+        )
+        self.assertEqual(self.page_through(), expected)
+
+    def test_recipe_added_between_pages(self):
+        """Новый рецепт с той же датой встаёт перед уже отданными и не
+        сдвигает следующие страницы."""
+        expected = list(
+            Recipe.objects.order_by('-created', '-pk')
+            .values_list('pk', flat=True)
+        )
+        ids = self.page_through(lambda: self.add_recipe(7))
+        self.assertEqual(ids, expected)
+
+    def test_invalid_cursor(self):
+        response = APIClient().get('/api/recipes/?pagination=cursor'
+                                   '&cursor=bm90LWEtY3Vyc29y')
+        self.assertEqual(response.status_code, 404)
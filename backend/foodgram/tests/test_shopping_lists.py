@@ -0,0 +1,159 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from recipes import saved
+from recipes.models import (Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingListItem)
+from users.models import User
+
+
+class ShoppingListTotalsTest(TestCase):
+    """Сводный список покупок, когда рецепт лежит в нескольких корзинах."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create(username=f'user{i}',
+                                email=f'user{i}@example.com')
+            for i in range(2)
+        ]
+        cls.ingredient = Ingredient.objects.create(
+            name='мука', measurement_unit='г'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.users[0], name='блины', image='recipes/images/x.jpg',
+            text='Описание', cooking_time=10,
+        )
+        RecipeIngredient.objects.create(
+            recipe=cls.recipe, ingredient=cls.ingredient, amount=200
+        )
+        for user in cls.users:
+            saved.add(ShoppingCart, user, [cls.recipe.pk])
+
+    def amount(self, user):
+        return ShoppingListItem.objects.get(
+            user=user, ingredient=self.ingredient
+        ).amount
+
+    def test_check_user_with_shared_recipe(self):
+        out = StringIO()
+        call_command('rebuild_shopping_lists', '--check',
+                     '--user', str(self.users[0].pk), stdout=out)
+        self.assertIn('Расхождений нет', out.getvalue())
+
+    def test_rebuild_user_with_shared_recipe(self):
+        ShoppingListItem.objects.rebuild(user_ids=[self.users[0].pk])
+        self.assertEqual(self.amount(self.users[0]), 200)
+        self.assertEqual(self.amount(self.users[1]), 200)
+
+    def test_live_totals_for_user(self):
+        self.assertEqual(
+            ShoppingListItem.objects.live_totals([self.users[1].pk]),
+            {(self.users[1].pk, self.ingredient.pk): 200},
+        )
+
+
+class ShoppingListRecipeChangesTest(TestCase):
+    """Сводный список покупок после правки и удаления рецепта в обход
+    API: в админке и через модели."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin'
+        )
+        cls.buyer = User.objects.create(
+            username='buyer', email='buyer@example.com'
+        )
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(3)
+        ]
+        cls.recipes = []
+        for i in range(2):
+            recipe = Recipe.objects.create(
+                author=cls.admin, name=f'рецепт {i}',
+                image='recipes/images/x.jpg', text='Описание',
+                cooking_time=10,
+            )
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=cls.ingredients[0], amount=100
+            )
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=cls.ingredients[i + 1], amount=50
+            )
+            cls.recipes.append(recipe)
+        saved.add(ShoppingCart, cls.buyer,
+                  [recipe.pk for recipe in cls.recipes])
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def assert_lists_match(self):
+        out = StringIO()
+        call_command('rebuild_shopping_lists', '--check', stdout=out)
+        self.assertIn('Расхождений нет', out.getvalue())
+
+    def amounts(self):
+        return dict(self.buyer.shopping_list.values_list(
+            'ingredient_id', 'amount'))
+
+    def test_admin_delete(self):
+        recipe = self.recipes[0]
+        response = self.client.post(
+            f'/admin/recipes/recipe/{recipe.pk}/delete/', {'post': 'yes'}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Recipe.objects.filter(pk=recipe.pk).exists())
+        self.assertEqual(self.amounts(), {
+            self.ingredients[0].pk: 100, self.ingredients[2].pk: 50,
+        })
+        self.assert_lists_match()
+
+    def test_admin_delete_selected(self):
+        response = self.client.post('/admin/recipes/recipe/', {
+            'action': 'delete_selected', 'post': 'yes',
+            '_selected_action': [recipe.pk for recipe in self.recipes],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.amounts(), {})
+        self.assert_lists_match()
+
+    def test_ingredient_rows_saved_and_deleted(self):
+        # Так строки состава меняет встроенная форма рецепта в админке.
+        row = RecipeIngredient.objects.get(
+            recipe=self.recipes[0], ingredient=self.ingredients[0]
+        )
+        row.amount = 30
+        row.save()
+        self.assert_lists_match()
+        row.ingredient = self.ingredients[2]
+        row.save()
+        self.assert_lists_match()
+        RecipeIngredient.objects.create(
+            recipe=self.recipes[1], ingredient=self.ingredients[1],
+            amount=5,
+        )
+        self.assert_lists_match()
+        RecipeIngredient.objects.get(
+            recipe=self.recipes[1], ingredient=self.ingredients[0]
+        ).delete()
+        self.assert_lists_match()
+        self.assertEqual(self.amounts(), {
+            self.ingredients[1].pk: 55, self.ingredients[2].pk: 80,
+        })
+
+    def test_recipe_update_through_api(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.patch(
+            f'/api/recipes/{self.recipes[0].pk}/',
+            {'ingredients': [{'id': self.ingredients[2].pk, 'amount': 7}]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assert_lists_match()
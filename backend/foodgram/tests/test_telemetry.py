@@ -0,0 +1,45 @@
+from unittest import mock
+
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from foodgram import telemetry
+from recipes import saved
+from recipes.models import (Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart)
+from users.models import User
+
+
+class StreamingTelemetryTest(TestCase):
+    """Замер потоковой выгрузки списка покупок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user',
+                                       email='user@example.com')
+        recipe = Recipe.objects.create(
+            author=cls.user, name='блины', image='recipes/images/x.jpg',
+            text='Описание', cooking_time=10,
+        )
+        RecipeIngredient.objects.create(
+            recipe=recipe, amount=200,
+            ingredient=Ingredient.objects.create(
+                name='мука', measurement_unit='г'
+            ),
+        )
+        saved.add(ShoppingCart, cls.user, [recipe.pk])
+
+    def test_body_queries_are_recorded(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with mock.patch.object(telemetry, 'observe') as observe:
+            response = client.get('/api/recipes/download_shopping_cart/')
+            self.assertIn('partial', response['Server-Timing'])
+            observe.assert_not_called()
+            body = b''.join(response.streaming_content)
+            response.close()
+        observe.assert_called_once()
+        record = observe.call_args.args[0]
+        self.assertGreater(record.queries, 0)
+        self.assertEqual(record.size, len(body))
+        self.assertIn('мука'.encode(), body)
@@ -1,18 +1,28 @@
 from django.contrib import admin
+
+from foodgram.paginators import EstimatedCountPaginator
 from users.models import Follow, User
 
 
 class CustomUserAdmin(admin.ModelAdmin):
-    list_display = ('id', 'username', 'role')
-    list_filter = ('email', 'first_name')
+    list_display = ('id', 'username', 'email', 'role', 'recipes_count',
+                    'followers_count')
+    list_filter = ('role', 'is_staff', 'is_active')
+    search_fields = ('username', 'email', 'first_name', 'last_name')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 class FollowAdmin(admin.ModelAdmin):
     list_display = ('user', 'following')
+    list_select_related = ('user', 'following')
     search_fields = (
         'user__username', 'user__email', 'following__username',
         'following__email'
     )
+    autocomplete_fields = ('user', 'following')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 admin.site.register(User, CustomUserAdmin)
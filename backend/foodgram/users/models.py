@@ -9,7 +9,23 @@ ROLES = (
 )
 
 
-class User(AbstractUser):
+class CountersMixin:
+    """Счётчики меняются только F()-обновлениями (recipes/counters.py):
+    обычный save() их не записывает, чтобы не затереть чужие изменения
+    значениями, прочитанными раньше."""
+    counters = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            skipped = set(self.counters) | self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(CountersMixin, AbstractUser):
     """Кастомная модель юзера."""
     username = models.CharField(
         verbose_name='Имя пользователя',
@@ -50,6 +66,18 @@ class User(AbstractUser):
         default=USER,
         error_messages={'role': 'Неверная роль'}
     )
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0,
+        editable=False,
+    )
+
+    counters = ('recipes_count', 'followers_count')
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('first_name', 'last_name', 'password', 'username')